@@ -0,0 +1,117 @@
+# Neutrino Framework
+#
+# Copyright (c) 2016-2017, Christiaan Frans Rademan
+# All rights reserved.
+#
+# LICENSE: (BSD3-Clause)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENTSHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# JSON backend micro-benchmark.
+#
+# Serializes and parses a list model of 1000 rows with every JSON library
+# installed that nfw.utils.fastjson can use, including the standard
+# library it falls back to.
+#
+#   python benchmarks/fastjson.py
+#
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+import nfw
+from nfw.utils import fastjson
+
+
+class Person(nfw.Model):
+    firstname = nfw.Model.Text()
+    lastname = nfw.Model.Text()
+    email = nfw.Model.Email()
+    age = nfw.Model.Integer()
+    score = nfw.Model.Number()
+    active = nfw.Model.Bool()
+    created = nfw.Model.Datetime()
+
+
+def model(number):
+    people = Person()
+    for i in range(number):
+        people.append({'firstname': 'John%s' % (i,),
+                       'lastname': 'Doe',
+                       'email': 'john%s@example.com' % (i,),
+                       'age': i % 100,
+                       'score': i / 3.0,
+                       'active': True,
+                       'created': datetime(2017, 1, 1, 12, 0, i % 60)},
+                      validate=False)
+    return people
+
+
+def backends():
+    found = []
+    for candidate in fastjson._candidates + (fastjson._stdlib,):
+        try:
+            selected = candidate()
+        except ImportError:
+            continue
+        if fastjson._usable(selected[1]):
+            found.append(selected)
+    return found
+
+
+def run(people, repeat=5):
+    default = people._JsonEncoder().default
+    document = people.dump_json()
+    results = []
+    for name, dumps, loads in backends():
+        def encode():
+            dumps(people, default=default)
+
+        def decode():
+            loads(document)
+
+        results.append((name,
+                        min(timeit.repeat(encode, number=1, repeat=repeat)),
+                        min(timeit.repeat(decode, number=1, repeat=repeat))))
+    return results
+
+
+def main():
+    print("selected: %s for dumps, %s for loads" % (fastjson.encoder,
+                                                     fastjson.decoder))
+    print("%12s %12s %12s" % ('backend', 'dumps ms', 'loads ms'))
+    for name, encode, decode in run(model(1000)):
+        print("%12s %12.2f %12.2f" % (name, encode * 1000, decode * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# Neutrino Framework
+#
+# Copyright (c) 2016-2017, Christiaan Frans Rademan
+# All rights reserved.
+#
+# LICENSE: (BSD3-Clause)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENTSHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# Model construction micro-benchmark.
+#
+# Compares constructing models with 5, 20 and 50 fields when the declared
+# fields are scanned for every instance, as before they were cached per
+# class, with the cached metadata.
+#
+#   python benchmarks/model.py
+#
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+import nfw
+
+
+def build(count):
+    attrs = {}
+    for i in range(count):
+        attrs['field%s' % (i,)] = nfw.Model.Text()
+    return type(str('Model%s' % (count,)), (nfw.Model,), attrs)
+
+
+def run(count, number=500, repeat=3):
+    model = build(count)
+
+    def construct(cached):
+        def init():
+            for _ in range(number):
+                if not cached:
+                    # Costs the same as scanning the declared fields for
+                    # every instance.
+                    nfw.model._class_fields.clear()
+                model()
+        return init
+
+    results = []
+    for cached in (False, True):
+        func = construct(cached)
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        results.append(best / number * 1000000)
+    return results
+
+
+def main():
+    print("%8s %12s %12s" % ('fields', 'scan us', 'cached us'))
+    for count in (5, 20, 50):
+        print("%8s %12.2f %12.2f" % ((count,) + tuple(run(count))))
+
+
+if __name__ == '__main__':
+    main()
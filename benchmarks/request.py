@@ -0,0 +1,114 @@
+# Neutrino Framework
+#
+# Copyright (c) 2016-2017, Christiaan Frans Rademan
+# All rights reserved.
+#
+# LICENSE: (BSD3-Clause)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENTSHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# Per-request allocation benchmark.
+#
+# Builds the Request and Response for a trivial GET request and reports
+# the memory held by each live pair and the number of allocations made,
+# as traced by tracemalloc, along with the time taken. Run it against two
+# checkouts to compare them.
+#
+#   python3 benchmarks/request.py
+#
+from __future__ import print_function
+
+import io
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+import nfw
+
+
+class App(object):
+    context = {}
+
+
+def environ():
+    return {'REQUEST_METHOD': 'GET',
+            'SCRIPT_NAME': '',
+            'PATH_INFO': '/',
+            'QUERY_STRING': 'page=1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(),
+            'HTTP_HOST': 'localhost',
+            'HTTP_USER_AGENT': 'Mozilla/5.0 (X11; Linux x86_64)',
+            'HTTP_ACCEPT': 'text/html,application/xhtml+xml',
+            'HTTP_ACCEPT_ENCODING': 'gzip, deflate',
+            'HTTP_ACCEPT_LANGUAGE': 'en-US,en;q=0.5',
+            'HTTP_CONNECTION': 'keep-alive'}
+
+
+def request(env, logger, app):
+    req = nfw.Request(env, {}, {}, None, logger, app)
+    resp = nfw.Response(req)
+    if req.method == nfw.HTTP_GET:
+        resp.body = 'Hello World'
+    return req, resp
+
+
+def run(number=2000, repeat=3):
+    logger = nfw.Logger('benchmark', None, None, False)
+    app = App()
+    envs = [environ() for _ in range(number)]
+    # Warm up caches so only the per-request cost is traced.
+    request(environ(), logger, app)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    held = [request(env, logger, app) for env in envs]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    size = sum(stat.size_diff for stat in stats)
+    count = sum(stat.count_diff for stat in stats)
+    del held
+
+    best = min(timeit.repeat(lambda: request(environ(), logger, app),
+                             number=number, repeat=repeat))
+    return size / number, count / number, best / number * 1000000
+
+
+def main():
+    size, count, us = run()
+    print("%12s %12s %12s" % ('bytes/req', 'blocks/req', 'us/req'))
+    print("%12.0f %12.1f %12.2f" % (size, count, us))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# Neutrino Framework
+#
+# Copyright (c) 2016-2017, Christiaan Frans Rademan
+# All rights reserved.
+#
+# LICENSE: (BSD3-Clause)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENTSHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# Route lookup micro-benchmark.
+#
+# Compares the original linear scan with the tree and regex matchers of
+# nfw.Router for 10, 100 and 1000 routes.
+#
+#   python benchmarks/router.py
+#
+from __future__ import print_function
+
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+import nfw
+
+
+def linear_match(routes, method, request_uri):
+    # Router._match as it was before routes were compiled.
+    uri = request_uri.split('/')
+    for r in routes:
+        r_method, r_uri, r_obj, r_name = r
+        r_uri = r_uri.split('/')
+        if method == r_method:
+            if len(uri) == len(r_uri):
+                kwargs = {}
+                for (i, v) in enumerate(r_uri):
+                    if len(v) > 0 and v[0] == '{':
+                        v = v.replace('{', '').replace('}', '')
+                        kwargs[v] = uri[i]
+                    elif v != uri[i]:
+                        break
+                    if i+1 == len(r_uri):
+                        return [r, kwargs]
+    return None
+
+
+def view(req, resp, **kwargs):
+    pass
+
+
+def build(matcher, count):
+    router = nfw.Router(matcher)
+    for i in range(count):
+        router.add(nfw.HTTP_GET, '/resource%s' % (i,), view)
+        router.add(nfw.HTTP_GET, '/resource%s/{id}' % (i,), view)
+        router.add(nfw.HTTP_PUT, '/resource%s/{id}/{field}' % (i,), view)
+    router.compile()
+    return router
+
+
+def requests(count, number):
+    random.seed(count)
+    uris = []
+    for _ in range(number):
+        i = random.randint(0, count - 1)
+        uris.append((nfw.HTTP_GET, 'resource%s/%s' % (i, random.randint(0, 999))))
+    return uris
+
+
+def run(count, number=2000, repeat=3):
+    uris = requests(count, number)
+    tree = build('tree', count // 3 or 1)
+    regex = build('regex', count // 3 or 1)
+
+    def linear():
+        for method, uri in uris:
+            linear_match(tree.routes, method, uri)
+
+    def compiled(router):
+        def lookup():
+            for method, uri in uris:
+                router._match(method, uri)
+        return lookup
+
+    results = []
+    for name, func in (('linear', linear),
+                       ('tree', compiled(tree)),
+                       ('regex', compiled(regex))):
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        results.append((name, best / number * 1000000))
+    return results
+
+
+def main():
+    print("%8s %12s %12s %12s" % ('routes', 'linear us', 'tree us',
+                                  'regex us'))
+    for count in (10, 100, 1000):
+        results = run(count)
+        print("%8s %12.2f %12.2f %12.2f" % ((count,) +
+                                            tuple(r[1] for r in results)))
+
+
+if __name__ == '__main__':
+    main()
@@ -33,11 +33,8 @@
 import os
 import sys
 import site
-import re
 import argparse
 import logging
-import time
-import datetime
 import hashlib
 from wsgiref import simple_server
 
@@ -192,25 +189,18 @@ def create(args):
 
 def session(args):
     path = args.path
-    c = 0
     if os.path.exists("%s/settings.cfg" % (path,)):
         config = nfw.Config("%s/settings.cfg" % (path,))
-        app_config = config.get('application', {})
+        app_config = config.get('application')
         session_expire = app_config.get('session_expire', 3600)
-        r = re.compile('^.*session$')
         if os.path.exists("%s/tmp" % (path,)):
-            files = os.listdir("%s/tmp" % (path,))
-            for f in files:
-                fpath = "%s/tmp/%s" % (path, f)
-                if os.path.isfile(fpath):
-                    if r.match(fpath):
-                        now = datetime.datetime.now()
-                        ts = int(time.mktime(now.timetuple()))
-                        stat = os.stat(fpath)
-                        lm = int(stat.st_mtime)
-                        if ts - lm > session_expire:
-                            os.remove(fpath)
-                            c += 1
+            gc = nfw.SessionCollector(path,
+                                      expire=session_expire,
+                                      batch=app_config.get('session_gc_batch',
+                                                           500),
+                                      pause=app_config.get('session_gc_pause',
+                                                           0.05))
+            c = gc.sweep(wait=True)
             print "Removed expired sessions: %s\n" % (c,)
         else:
             print("Missing tmp folder")
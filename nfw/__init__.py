@@ -75,6 +75,9 @@ from .mysql import Mysql
 from .redissy import redis
 from .session import SessionRedis
 from .session import SessionFile
+from .session import SessionShardedFile
+from .session import SessionCookie
+from .session import SessionCollector
 from .policy import Policy
 from .router import Router
 from .router import view
@@ -86,6 +89,8 @@ from .response import http_see_other
 from .response import http_temporary_redirect
 from .response import http_permanent_redirect
 from .headers import Headers
+from .headers import ResponseHeaders
+from .headers import EnvironView
 from . import password
 from . import template
 from .wsgi import Wsgi
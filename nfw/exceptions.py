@@ -68,6 +68,15 @@ class RestClientError(Error):
         return str(self.description)
 
 
+class PoolTimeout(Error):
+    def __init__(self, description):
+        Exception.__init__(self, description)
+        self.description = description
+
+    def __str__(self):
+        return str(self.description)
+
+
 class FieldError(ValidationError):
     def __init__(self, field, label, description, value):
         self.error = "%s %s %s" % (field, description, value)
@@ -164,8 +173,10 @@ class HTTPMethodNotAllowed(HTTPError):
     """405 Method Not Allowed.
     """
 
-    def __init__(self, allowed_methods=None):
-        super(HTTPMethodNotAllowed, self).__init__(nfw.HTTP_405)
+    def __init__(self, allowed_methods=None, title='Method not allowed',
+                 description=None):
+        super(HTTPMethodNotAllowed, self).__init__(nfw.HTTP_405, title,
+                                                   description)
         if allowed_methods is not None:
             self.headers['Allow'] = ', '.join(allowed_methods)
 
@@ -206,6 +217,15 @@ class HTTPPreconditionFailed(HTTPError):
                                                      description)
 
 
+class HTTPPayloadTooLarge(HTTPError):
+    """413 Payload Too Large.
+    """
+
+    def __init__(self, description=None):
+        super(HTTPPayloadTooLarge, self).__init__(
+            nfw.HTTP_413, 'Payload too large', description)
+
+
 class HTTPUnsupportedMediaType(HTTPError):
     """415 Unsupported Media Type.
     """
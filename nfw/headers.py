@@ -34,7 +34,14 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import sys
 import logging
+if sys.version[0] == '2':
+    import urlparse
+    from Cookie import SimpleCookie
+else:
+    from urllib import parse as urlparse
+    from http.cookies import SimpleCookie
 
 import nfw
 
@@ -102,3 +109,143 @@ class Headers(object):
                 return str(self.data[key]).encode('utf-8')
         except KeyError:
             return default
+
+
+def _wire(value):
+    value = nfw.utils.if_unicode_to_utf8(value)
+    if nfw.utils.is_byte_string(value):
+        return value
+    return str(value).encode('utf-8')
+
+
+class ResponseHeaders(object):
+    # Case-insensitive response headers. Names and values are converted
+    # once when set and kept as the list of (name, value) tuples passed to
+    # start_response, so a header such as Set-Cookie can be sent more than
+    # once with add().
+    __slots__ = ('_items', '_index')
+
+    def __init__(self, headers=None):
+        self._items = []
+        self._index = {}
+        if headers is not None:
+            self.update(headers)
+
+    def _remove(self, key):
+        self._items = [h for h in self._items if h[0].lower() != key]
+        del self._index[key]
+
+    def __setitem__(self, name, value):
+        name = str(name)
+        key = name.lower()
+        if key in self._index:
+            self._remove(key)
+        value = _wire(value)
+        self._items.append((name, value))
+        self._index[key] = [value]
+
+    def add(self, name, value):
+        name = str(name)
+        value = _wire(value)
+        self._items.append((name, value))
+        self._index.setdefault(name.lower(), []).append(value)
+
+    def __getitem__(self, name):
+        return self._index[str(name).lower()][0]
+
+    def __delitem__(self, name):
+        key = str(name).lower()
+        if key in self._index:
+            self._remove(key)
+
+    def __contains__(self, name):
+        return str(name).lower() in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __repr__(self):
+        return repr(self._items)
+
+    def __str__(self):
+        return str(self._items)
+
+    def update(self, headers):
+        if isinstance(headers, ResponseHeaders):
+            headers = headers._items
+        elif hasattr(headers, 'items'):
+            headers = headers.items()
+        for name, value in headers:
+            self[name] = value
+
+    def get(self, name, default=None):
+        try:
+            return self._index[str(name).lower()][0]
+        except KeyError:
+            return default
+
+    def getlist(self, name):
+        return list(self._index.get(str(name).lower(), ()))
+
+    def items(self):
+        # The list of (name, value) tuples for start_response.
+        return self._items
+
+
+class EnvironView(object):
+    # Request headers, query string and cookies parsed from environ on
+    # first access. One view is kept in environ per request, so Request,
+    # the session and middleware all share the same parsed values. The
+    # query and cookies are parsed again if environ is rewritten.
+    __slots__ = ('environ', '_headers', '_query', '_query_string',
+                 '_cookies', '_cookie_string')
+
+    def __init__(self, environ):
+        self.environ = environ
+        self._headers = None
+        self._query = None
+        self._query_string = None
+        self._cookies = None
+        self._cookie_string = None
+
+    @classmethod
+    def get(cls, environ):
+        try:
+            return environ['nfw.view']
+        except KeyError:
+            view = environ['nfw.view'] = cls(environ)
+            return view
+
+    @property
+    def headers(self):
+        if self._headers is None:
+            headers = Headers()
+            data = headers.data
+            for p in self.environ:
+                if len(p) > 5 and p.startswith('HTTP_'):
+                    data[str(p[5:]).lower()] = self.environ[p]
+            self._headers = headers
+        return self._headers
+
+    @property
+    def query(self):
+        query_string = self.environ.get('QUERY_STRING', '')
+        if self._query is None or query_string is not self._query_string:
+            self._query = urlparse.parse_qs(query_string)
+            self._query_string = query_string
+        return self._query
+
+    @property
+    def cookies(self):
+        # Shared between readers, build a new SimpleCookie to set cookies.
+        cookie_string = self.environ.get('HTTP_COOKIE')
+        if self._cookies is None or cookie_string is not self._cookie_string:
+            cookies = SimpleCookie()
+            if cookie_string is not None:
+                cookies.load(cookie_string)
+            self._cookies = cookies
+            self._cookie_string = cookie_string
+        return self._cookies
@@ -41,12 +41,9 @@ import logging
 import logging.handlers
 import inspect
 import time
-if sys.version[0] == '2':
-    import thread
-else:
-    import _thread as thread
 
 import nfw
+from nfw.utils import request_context
 
 
 class Logger(object):
@@ -72,29 +69,27 @@ class Logger(object):
             return True
 
     def set_extra(self, value):
-        thread_id = thread.get_ident()
-        self._request[thread_id] = []
-        self._request[thread_id].append(value)
+        request_context.set('log_extra', [value])
 
     def append_extra(self, value):
-        thread_id = thread.get_ident()
-        if thread_id not in self._request:
-            self._request[thread_id] = []
-        self._request[thread_id].append(value)
+        request_context.get('log_extra', list).append(value)
 
     def _get_extra(self):
-        thread_id = thread.get_ident()
-        if thread_id in self._request:
-            return " ".join(self._request[thread_id])
+        extra = request_context.get('log_extra')
+        if extra is not None:
+            return " ".join(extra)
         else:
             return ""
 
     def __init__(self, app_name, host, port, debug):
-        self._request = {}
-
         logger = logging.getLogger()
 
-        logger.setLevel(logging.DEBUG)
+        # Debug records are dropped at the logger rather than in the
+        # handler filters, so callers can cheaply skip building them.
+        if debug is True:
+            logger.setLevel(logging.DEBUG)
+        else:
+            logger.setLevel(logging.INFO)
 
         if host is not None and (host == '127.0.0.1' or host == 'localhost'):
             if self._is_socket('/dev/log'):
@@ -42,9 +42,11 @@ from datetime import datetime
 import json
 import uuid
 import re
+import weakref
 
 import nfw
 from nfw.utils import ObjectName
+from nfw.utils import fastjson
 
 log = logging.getLogger(__name__)
 
@@ -62,6 +64,27 @@ def _declared_fields(cls):
     return OrderedDict(current_fields)
 
 
+# Declared fields per model class, computed the first time a class is
+# instantiated rather than scanning dir() and copying every Field for each
+# instance. Instances share the same ordered mapping, which must not be
+# modified, along with the Field templates in it since _get_field copies
+# them on use. A variant including the implicit integer primary key is
+# kept for each primary key name.
+_class_fields = weakref.WeakKeyDictionary()
+
+
+def _model_fields(cls, primary_key=None):
+    try:
+        fields = _class_fields[cls]
+    except KeyError:
+        fields = _class_fields[cls] = {None: _declared_fields(cls)}
+    if primary_key not in fields:
+        with_key = OrderedDict(fields[None])
+        with_key[primary_key] = nfw.Model.Integer(hidden=True)
+        fields[primary_key] = with_key
+    return fields[primary_key]
+
+
 class FieldChecks(object):
     def validate_length(self, value):
         if (self.max_length is not None and
@@ -178,6 +201,109 @@ class FieldChecks(object):
                                  value)
 
 
+# SQL built for each (table, primary key), shared by every instance of a
+# model. Field subsets are keyed on the tuple of column names in declared
+# order, so each distinct statement is only ever formatted once.
+_statements = {}
+
+
+class _Statements(object):
+    def __init__(self, table, primary_key):
+        self.table = table
+        self.primary_key = primary_key
+        self._select = {}
+        self._foreign_key = {}
+        self._insert = {}
+        self._update = {}
+        self._bulk_insert = {}
+        self._bulk_update = {}
+        self.delete = "DELETE FROM %s WHERE %s = %s" % (table,
+                                                        primary_key,
+                                                        '%s')
+
+    def select(self, fields):
+        try:
+            return self._select[fields]
+        except KeyError:
+            sql = "SELECT %s FROM %s" % (", ".join(fields), self.table,)
+            sql += " WHERE %s = %s" % (self.primary_key, '%s')
+            self._select[fields] = sql
+            return sql
+
+    def foreign_key(self, fields, key):
+        try:
+            return self._foreign_key[(fields, key)]
+        except KeyError:
+            sql = "SELECT %s FROM %s" % (", ".join(fields), self.table,)
+            sql += " WHERE %s = %s" % (key, '%s')
+            self._foreign_key[(fields, key)] = sql
+            return sql
+
+    def insert(self, fields):
+        try:
+            return self._insert[fields]
+        except KeyError:
+            sql = "INSERT INTO %s (%s)" % (self.table, ",".join(fields)) +\
+                  " VALUES (%s)" % (",".join(['%s'] * len(fields)),)
+            self._insert[fields] = sql
+            return sql
+
+    def update(self, fields):
+        try:
+            return self._update[fields]
+        except KeyError:
+            update = ",".join(["%s=%s" % (field, '%s') for field in fields])
+            sql = "UPDATE %s SET %s" % (self.table, update) +\
+                  " WHERE %s = %s" % (self.primary_key, '%s')
+            self._update[fields] = sql
+            return sql
+
+    def bulk_insert(self, fields, count, upsert=False):
+        # Multi-row INSERT, optionally updating every non primary key
+        # column of rows that already exist.
+        try:
+            return self._bulk_insert[(fields, count, upsert)]
+        except KeyError:
+            row = "(%s)" % (",".join(['%s'] * len(fields)),)
+            sql = "INSERT INTO %s (%s)" % (self.table, ",".join(fields)) +\
+                  " VALUES %s" % (",".join([row] * count),)
+            if upsert is True:
+                update = ["%s=VALUES(%s)" % (field, field)
+                          for field in fields
+                          if field != self.primary_key]
+                if len(update) == 0:
+                    update = ["%s=%s" % (self.primary_key, self.primary_key)]
+                sql += " ON DUPLICATE KEY UPDATE %s" % (",".join(update),)
+            self._bulk_insert[(fields, count, upsert)] = sql
+            return sql
+
+    def bulk_update(self, fields, count):
+        # Multi-row UPDATE selecting each column value by primary key. The
+        # values are expected as (id, value) pairs per column followed by
+        # the ids for the WHERE clause.
+        try:
+            return self._bulk_update[(fields, count)]
+        except KeyError:
+            when = " ".join(["WHEN %s THEN %s"] * count)
+            update = ",".join(["%s=CASE %s %s ELSE %s END" %
+                               (field, self.primary_key, when, field)
+                               for field in fields])
+            sql = "UPDATE %s SET %s" % (self.table, update) +\
+                  " WHERE %s IN (%s)" % (self.primary_key,
+                                         ",".join(['%s'] * count))
+            self._bulk_update[(fields, count)] = sql
+            return sql
+
+
+def _get_statements(table, primary_key):
+    try:
+        return _statements[(table, primary_key)]
+    except KeyError:
+        statements = _statements[(table, primary_key)] = _Statements(
+            table, primary_key)
+        return statements
+
+
 class Mysql(object):
     def __init__(self, db, model_name, meta, declared_fields):
         self.db = db
@@ -193,6 +319,9 @@ class Mysql(object):
         else:
             self.db_primary_key = 'id'
 
+        self._statements = _get_statements(self.db_table,
+                                           self.db_primary_key)
+
         if hasattr(meta, 'db_query'):
             self.db_query = meta.db_query
         else:
@@ -200,9 +329,7 @@ class Mysql(object):
             self.db_query = "SELECT %s FROM %s" % (fields, self.db_table,)
 
     def foreign_key(self, id=None, key=None):
-        fields = ", ".join(self.declared_fields)
-        sql = "SELECT %s FROM %s" % (fields, self.db_table,)
-        sql += " WHERE %s = %s" % (key, '%s')
+        sql = self._statements.foreign_key(tuple(self.declared_fields), key)
         result = self.db.execute(sql, (id,))
         if len(result) > 0:
             if len(result) == 1:
@@ -216,9 +343,7 @@ class Mysql(object):
 
         result = None
         if id is not None:
-            fields = ", ".join(self.declared_fields)
-            sql = "SELECT %s FROM %s" % (fields, self.db_table,)
-            sql += " WHERE %s = %s" % (self.db_primary_key, '%s')
+            sql = self._statements.select(tuple(self.declared_fields))
             result = self.db.execute(sql, (id,))
             if len(result) > 0:
                 if len(result) != 1:
@@ -229,6 +354,17 @@ class Mysql(object):
             result = self.db.execute(sql, values)
         return self._clean(result)
 
+    def iterate(self, sql=None, values=None, batch_size=1000):
+        if sql is None:
+            sql = self.db_query
+        declared_fields = self.declared_fields
+        for r in self.db.iterate(sql, values, batch_size):
+            t = {}
+            for f in r:
+                if f in declared_fields:
+                    t[f] = r[f]
+            yield t
+
     def _clean(self, result):
         clean = []
         for r in result:
@@ -239,65 +375,202 @@ class Mysql(object):
             clean.append(t)
         return clean
 
-    def insert(self, data):
+    def _fields(self, data):
         fields = []
         values = []
-
-        insert = []
-        sql_str_values = []
         for declared_field in self.declared_fields:
             if declared_field in data:
-                field = declared_field
-                fields.append(field)
-                values.append(data[field])
-                insert.append("%s" % (field))
-                sql_str_values.append("%s" % ('%s'))
-
-        insert = ",".join(insert)
-        sql_str_values = ",".join(sql_str_values)
+                fields.append(declared_field)
+                values.append(data[declared_field])
+        return (tuple(fields), values)
 
-        sql = "INSERT INTO %s (%s)" % (self.db_table, insert) +\
-              " VALUES (%s)" % (sql_str_values,)
+    def insert(self, data):
+        fields, values = self._fields(data)
+        sql = self._statements.insert(fields)
         self.db.execute(sql, tuple(values))
 
         return self.db.last_row_id()
 
     def update(self, data, id):
-        fields = []
-        values = []
-        update = []
-        sql_str_values = []
-        for declared_field in self.declared_fields:
-            if declared_field in data:
-                field = declared_field
-                fields.append(field)
-                values.append(data[field])
-                update.append("%s=%s" % (field, "%s"))
+        fields, values = self._fields(data)
         values.append(id)
-
-        update = ",".join(update)
-
-        sql = "UPDATE %s SET %s" % (self.db_table, update) +\
-              " WHERE %s = %s" % (self.db_primary_key, '%s')
+        sql = self._statements.update(fields)
         self.db.execute(sql, tuple(values))
 
+    def bulk(self, rows, update=False, upsert=False, chunk_size=500):
+        # Write rows with as few statements as possible. Rows are grouped
+        # by the columns they provide, since a multi-row statement needs
+        # the same columns for every row. As with the other writes the
+        # caller commits or rolls back.
+        groups = OrderedDict()
+        for row in rows:
+            fields, values = self._fields(row)
+            if fields not in groups:
+                groups[fields] = []
+            if update is True:
+                values = (row[self.db_primary_key], values)
+            groups[fields].append(values)
+
+        for fields in groups:
+            group = groups[fields]
+            for start in range(0, len(group), chunk_size):
+                chunk = group[start:start + chunk_size]
+                if update is True:
+                    self._bulk_update(fields, chunk)
+                else:
+                    sql = self._statements.bulk_insert(fields, len(chunk),
+                                                       upsert)
+                    values = []
+                    for row in chunk:
+                        values.extend(row)
+                    self.db.execute(sql, tuple(values))
+
+    def _bulk_update(self, fields, chunk):
+        columns = tuple([field for field in fields
+                         if field != self.db_primary_key])
+        values = []
+        for field in columns:
+            for id, row in chunk:
+                values.append(id)
+                values.append(row[fields.index(field)])
+        for id, row in chunk:
+            values.append(id)
+        if len(columns) > 0:
+            sql = self._statements.bulk_update(columns, len(chunk))
+            self.db.execute(sql, tuple(values))
+
     def commit(self):
         self.db.commit()
 
     def rollback(self):
         self.db.rollback()
 
+    def upsert(self, data):
+        fields, values = self._fields(data)
+        sql = self._statements.bulk_insert(fields, 1, upsert=True)
+        self.db.execute(sql, tuple(values))
+
     def delete(self, id):
-        sql = "DELETE FROM %s WHERE %s = %s" % (self.db_table,
-                                                self.db_primary_key,
-                                                '%s')
-        self.db.execute(sql, (id,))
+        self.db.execute(self._statements.delete, (id,))
+
+
+class _RowIndex(OrderedDict):
+    # Column positions of a readonly result, shared by all of its rows,
+    # with the Password and JsonObject columns that Field.value() and
+    # _JsonEncoder treat specially.
+    def __init__(self, fields, row):
+        OrderedDict.__init__(self)
+        self.hidden = []
+        self.json = []
+        for name in fields:
+            if name in row:
+                self[name] = len(self)
+                if isinstance(fields[name], Fields.Password):
+                    self.hidden.append(name)
+                elif isinstance(fields[name], Fields.JsonObject):
+                    self.json.append(name)
+
+
+class Row(object):
+    # Read-only row returned by Model.query(readonly=True). All rows of a
+    # result share one index of column positions, so a row only holds a
+    # reference to it and a tuple of raw values.
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __setitem__(self, key, value):
+        raise nfw.ValidationError("Row is read-only")
+
+    def __delitem__(self, key):
+        raise nfw.ValidationError("Row is read-only")
+
+    def _set(self, value, validate=True):
+        raise nfw.ValidationError("Row is read-only")
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return repr(self.value())
+
+    def __str__(self):
+        return str(self.value())
+
+    def get(self, key, default=None):
+        try:
+            return self._values[self._index[key]]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self._index)
+
+    def items(self):
+        return list(zip(self._index, self._values))
+
+    def value(self):
+        # Passwords are left out as Field.value() does.
+        value = OrderedDict(zip(self._index, self._values))
+        for key in self._index.hidden:
+            value[key] = None
+        return value
+
+    def _json_value(self):
+        value = self.value()
+        for key in self._index.json:
+            data = value[key]
+            if data is not None and data.strip() != '':
+                value[key] = fastjson.loads(data)
+            else:
+                value[key] = None
+        return value
+
+
+def _stream_json(o, default):
+    # Walk lists and dictionaries of fields yielding JSON text, encoding
+    # only individual values at a time. Output matches dump_json().
+    if isinstance(o, Fields.List):
+        yield '['
+        for (i, row) in enumerate(o._data):
+            if i > 0:
+                yield ','
+            for chunk in _stream_json(row, default):
+                yield chunk
+        yield ']'
+    elif isinstance(o, (Fields.Dict, Row)):
+        if isinstance(o, Row):
+            items = o._json_value().items()
+        else:
+            items = o.value().items()
+        yield '{'
+        for (i, (key, value)) in enumerate(items):
+            if i > 0:
+                yield ','
+            yield fastjson.dumps(key)
+            yield ':'
+            for chunk in _stream_json(value, default):
+                yield chunk
+        yield '}'
+    else:
+        yield fastjson.dumps(o, default=default)
 
 
 class Field(ObjectName):
     def __init__(self, value=None, id=None, db=None, **kwargs):
         self.creation_counter = nfw.creation_counter()
-        self._declared_fields = _declared_fields(self)
+        self._declared_fields = _model_fields(self.__class__)
 
         self._id = id
         self._name = None
@@ -309,6 +582,8 @@ class Field(ObjectName):
         self._parent = None
         self._parent_key = None
         self._parent_key_value = None
+        # True once this row is known to exist in the database.
+        self._persisted = False
 
         if hasattr(self, '_init'):
             self._init()
@@ -359,12 +634,17 @@ class Field(ObjectName):
                              self._declared_fields)
             if hasattr(self.Meta, 'db_primary_key'):
                 self._db_primary_key = self.Meta.db_primary_key
-                if self._db_primary_key not in self._declared_fields:
-                    self._declared_fields[self._db_primary_key] = nfw.Model.Integer(hidden=True)
             else:
                 self._db_primary_key = 'id'
-                if self._db_primary_key not in self._declared_fields:
-                    self._declared_fields[self._db_primary_key] = nfw.Model.Integer(hidden=True)
+            if self._db_primary_key not in self._declared_fields:
+                if self._declared_fields is _model_fields(self.__class__):
+                    fields = _model_fields(self.__class__,
+                                           self._db_primary_key)
+                else:
+                    fields = OrderedDict(self._declared_fields)
+                    fields[self._db_primary_key] = nfw.Model.Integer(hidden=True)
+                self._declared_fields = fields
+                self._db.declared_fields = fields
 
     def _val(self, value, validate=True):
         if hasattr(self, '_validate') and validate is True:
@@ -395,39 +675,45 @@ class Field(ObjectName):
 
     class _JsonEncoder(json.JSONEncoder):
         def default(self, o):
-            if isinstance(o.value(), datetime):
+            if isinstance(o, datetime):
+                return str(o.strftime("%Y/%m/%d %H:%M:%S"))
+            elif isinstance(o, Row):
+                return o._json_value()
+            elif isinstance(o.value(), datetime):
                 return str(o.value().strftime("%Y/%m/%d %H:%M:%S"))
             elif isinstance(o, Fields.JsonObject):
                 if o.value() is not None and o.value().strip() != '':
-                    return json.loads(o.value())
+                    return fastjson.loads(o.value())
             else:
                 return o.value()
 
-    class _JsonDecoder(json.JSONDecoder):
-        def __init__(self, list_type=list,  **kwargs):
-            json.JSONDecoder.__init__(self, **kwargs)
-            # Use the custom JSONArray
-            self.parse_array = self.JSONArray
-            # Use the python implemenation of the scanner
-            self.scan_once = json.scanner.py_make_scanner(self)
-            self.list_type = list_type
-
-        def JSONArray(self, s_and_end, scan_once, **kwargs):
-            values, end = json.decoder.JSONArray(s_and_end,
-                                                 scan_once,
-                                                 **kwargs)
-            return self.list_type(values), end
-
     def dump_json(self, **kwargs):
-        return json.dumps(self,
-                          cls=self._JsonEncoder,
-                          **kwargs)
+        return fastjson.dumps(self,
+                              default=self._JsonEncoder().default,
+                              **kwargs)
+
+    def stream_json(self, chunk_size=16384):
+        # Generator of utf-8 JSON chunks of about chunk_size bytes, which a
+        # view can return to send a large model without building the whole
+        # document in memory.
+        default = self._JsonEncoder().default
+        buf = []
+        size = 0
+        for chunk in _stream_json(self, default):
+            buf.append(chunk)
+            size += len(chunk)
+            if size >= chunk_size:
+                yield ''.join(buf).encode('utf-8')
+                buf = []
+                size = 0
+        if len(buf) > 0:
+            yield ''.join(buf).encode('utf-8')
 
     def load_json(self, fp, **kwargs):
         if isinstance(self._data, list):
-            json.loads(fp, cls=self._JsonDecoder, list_type=self)
+            fastjson.loads(fp, list_type=self)
         elif isinstance(self._data, dict):
-            self._set(json.loads(fp, cls=self._JsonDecoder, list_type=self))
+            self._set(fastjson.loads(fp, list_type=self))
         else:
             raise nfw.ValidationError("'load_json() only works with dictionary/list")
 
@@ -484,17 +770,84 @@ class Fields(object):
             new._set(v, validate)
             self._data.append(new)
 
-        def query(self, sql=None, values=None):
+        def query(self, sql=None, values=None, readonly=False):
             if hasattr(self, '_db'):
                 self._data = []
                 result = self._db.select(sql=sql,values=values)
-                for row in result:
-                    self.append(row, False)
+                if readonly is True:
+                    # Skip building Field objects per row and column.
+                    index = None
+                    for row in result:
+                        if index is None:
+                            index = _RowIndex(self._declared_fields, row)
+                        self._data.append(Row(index,
+                                              tuple([row[f] for f in index])))
+                else:
+                    for row in result:
+                        self.append(row, False)
+                        self._data[-1]._persisted = True
+
+        def iter_query(self, sql=None, values=None, batch_size=1000):
+            # Yield rows as plain dictionaries without loading them into
+            # the model, for result sets too large to hold in memory.
+            if not hasattr(self, '_db'):
+                raise nfw.Error("iter_query requires a database")
+            return self._db.iterate(sql=sql, values=values,
+                                    batch_size=batch_size)
 
         def __call__(self, v):
             for i in v:
                 self.append(i)
 
+        def _bulk_row(self, row, new):
+            # Validate a row in memory the way append() would, without
+            # touching the database.
+            if not isinstance(row, dict):
+                raise nfw.ValidationError("'%s' Expecting dictionary" %
+                                          (str(self._objectname()),))
+            clean = {}
+            for key in row:
+                field = self._get_field(key)
+                if isinstance(field, Fields.List):
+                    raise nfw.ValidationError("Property is a List Model")
+                elif isinstance(field, Fields.Dict):
+                    clean[key] = row[key]
+                else:
+                    clean[key] = field._val(row[key])
+            if new is True and self._db_primary_key not in clean:
+                if hasattr(self, self._db_primary_key):
+                    pri_field = getattr(self, self._db_primary_key)
+                    if isinstance(pri_field, Fields.Uuid):
+                        clean[self._db_primary_key] = str(uuid.uuid4())
+            return clean
+
+        def _bulk(self, rows, new, update=False, upsert=False,
+                  chunk_size=500):
+            if not hasattr(self, '_db'):
+                raise nfw.Error("Bulk operations require a database")
+            clean = []
+            for row in rows:
+                row = self._bulk_row(row, new)
+                if update is True and self._db_primary_key not in row:
+                    raise nfw.ValidationError("Bulk update requires" +
+                                              " primary key '%s'" %
+                                              (self._db_primary_key,))
+                clean.append(row)
+            self._db.bulk(clean, update=update, upsert=upsert,
+                          chunk_size=chunk_size)
+            return len(clean)
+
+        def bulk_insert(self, rows, chunk_size=500):
+            return self._bulk(rows, True, chunk_size=chunk_size)
+
+        def bulk_update(self, rows, chunk_size=500):
+            return self._bulk(rows, False, update=True,
+                              chunk_size=chunk_size)
+
+        def bulk_upsert(self, rows, chunk_size=500):
+            return self._bulk(rows, True, upsert=True,
+                              chunk_size=chunk_size)
+
     class Dict(Field):
         def _init(self):
             self._data = {}
@@ -503,9 +856,11 @@ class Fields(object):
             if v is not None:
                 if isinstance(v, dict):
                     updates = {}
+                    changed = {}
                     for i in v:
                         val = v[i]
-                        if i not in self._data:
+                        new = i not in self._data
+                        if new:
                             self._data[i] = self._get_field(i)
                             if isinstance(self._data[i], Fields.List):
                                 raise nfw.ValidationError("Property is a" +
@@ -525,39 +880,41 @@ class Fields(object):
                                 fk = self._data[i].foreign_key
                                 if fk in val:
                                     updates[i] = val[fk]
+                                    changed[i] = val[fk]
                             else:
                                 self._data[i]._parent_key_value = val
                                 self._data[i].query()
                                 updates[i] = val
+                                changed[i] = val
                         else:
                             if (hasattr(self._data[i], '_validate') and
                                     validate is True):
                                 val = self._data[i]._validate(val)
+                            if new or self._data[i].value() != val:
+                                changed[i] = val
                             self._data[i]._set(val)
                             updates[i] = val
                     if hasattr(self, '_db') and validate is True:
                         if len(updates) > 0:
                             if self._db_primary_key in self._data:
                                 id = self._data[self._db_primary_key].value()
-                                if len(self._db.select(id=id)) > 0:
-                                        self._db.update(updates, id)
-                                else:
-                                    if hasattr(self, self._db_primary_key):
-                                        pri_field = getattr(self,
-                                                            self._db_primary_key)
-                                        if isinstance(pri_field, Fields.Uuid):
-                                            id = str(uuid.uuid4())
-                                            updates[self._db_primary_key] = id
-                                            self._db.insert(updates)
-                                        else:
-                                            id = self._db.insert(updates)
-                                    else:
-                                        id = self._db.insert(updates)
-                                    updates[self._db_primary_key] = id
-                                    if self.foreign_key in updates:
-                                        self._parent_key_value = updates[self.foreign_key]
-                                        self._parent._set({self._parent_key: self._parent_key_value})
-                                        self._data[self._db_primary_key] = id
+                            else:
+                                id = None
+                            if id is not None and self._persisted is True:
+                                # Loaded from or written to the database
+                                # already, only send what changed.
+                                changed.pop(self._db_primary_key, None)
+                                if len(changed) > 0:
+                                    self._db.update(changed, id)
+                            elif id is not None:
+                                # Primary key known, but the row may not
+                                # exist yet.
+                                updates[self._db_primary_key] = id
+                                self._db.upsert(updates)
+                                self._persisted = True
+                                if self.foreign_key in updates:
+                                    self._parent_key_value = updates[self.foreign_key]
+                                    self._parent._set({self._parent_key: self._parent_key_value})
                             else:
                                 self._data[self._db_primary_key] = self._get_field(self._db_primary_key)
                                 if hasattr(self, self._db_primary_key):
@@ -574,6 +931,7 @@ class Fields(object):
                                 updates[self._db_primary_key] = id
                                 self._data[self._db_primary_key]._set(id)
                                 self._id = id
+                                self._persisted = True
                                 if self.foreign_key in updates:
                                     self._parent_key_value = updates[self.foreign_key]
                                     self._parent._set({self._parent_key: self._parent_key_value})
@@ -617,6 +975,7 @@ class Fields(object):
                 if self._parent_key in self._parent:
                     self._parent[self._parent_key] = None
             self._data = {}
+            self._persisted = False
 
         def __iter__(self):
             results = OrderedDict()
@@ -638,17 +997,20 @@ class Fields(object):
                     if self._parent_key_value is not None:
                         self._id = self._db.foreign_key(self._parent_key_value, self.foreign_key)
                 self._data = {}
+                self._persisted = False
                 if self._id is not None:
                     result = self._db.select(id=self._id, sql=sql,
                                              values=values)
                     if len(result) == 1:
                         self._set(result[0], False)
+                        self._persisted = True
                 else:
                     if sql is not None:
                         result = self._db.select(sql=sql,
                                                  values=values)
-                    if len(result) == 1:
-                        self._set(result[0], False)
+                        if len(result) == 1:
+                            self._set(result[0], False)
+                            self._persisted = True
 
         def get(self, key, default=None):
             try:
@@ -35,13 +35,10 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import sys
+import time
 import logging
-if sys.version[0] == '2':
-    import thread
-    from Queue import Queue
-else:
-    import _thread as thread
-    from queue import Queue
+import threading
+from collections import deque
 
 try:
     import MySQLdb
@@ -50,20 +47,131 @@ except:
     import pymysql as MySQLdb
     import pymysql.cursors as cursors
 import nfw
+from nfw.utils import request_context
 
 log = logging.getLogger(__name__)
 
+lock = threading.Lock()
+
+
+class Pool(object):
+    # Connections are borrowed with get() and handed back with put(), or
+    # discard() when broken. When max_size connections are in use, get()
+    # waits up to timeout seconds for one to be returned. Connections idle
+    # for longer than idle seconds are closed, keeping at least min_size,
+    # and a connection is only pinged when it was idle for ping seconds.
+    # A max_size of 0 does not limit the pool.
+    def __init__(self, connect, min_size=0, max_size=0, timeout=30,
+                 idle=300, ping=60):
+        self._connect = connect
+        self.min_size = int(min_size)
+        self.max_size = int(max_size)
+        self.timeout = float(timeout)
+        self.idle = float(idle)
+        self.ping = float(ping)
+
+        self._idle = deque()
+        self._cond = threading.Condition()
+        self.in_use = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.created = 0
+        self.closed = 0
+
+    def _reap(self, now):
+        # Oldest idle connections are on the left.
+        expired = []
+        while (len(self._idle) > self.min_size and
+                now - self._idle[0][1] > self.idle):
+            expired.append(self._idle.popleft()[0])
+        self.closed += len(expired)
+        return expired
+
+    def _close(self, conns):
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def get(self):
+        conn = None
+        last_used = None
+        started = None
+        with self._cond:
+            expired = self._reap(time.time())
+            while True:
+                if len(self._idle) > 0:
+                    conn, last_used = self._idle.pop()
+                    break
+                if (self.max_size <= 0 or
+                        self.in_use + len(self._idle) < self.max_size):
+                    break
+                now = time.time()
+                if started is None:
+                    started = now
+                    self.waits += 1
+                remaining = started + self.timeout - now
+                if remaining <= 0:
+                    self.timeouts += 1
+                    self.wait_time += now - started
+                    raise nfw.PoolTimeout("Timed out waiting for" +
+                                          " database connection")
+                self._cond.wait(remaining)
+            if started is not None:
+                self.wait_time += time.time() - started
+            self.in_use += 1
+        self._close(expired)
+
+        try:
+            if conn is None:
+                conn = self._connect()
+                with self._cond:
+                    self.created += 1
+            elif time.time() - last_used > self.ping:
+                conn.ping(True)
+        except Exception:
+            with self._cond:
+                self.in_use -= 1
+                self._cond.notify()
+            if conn is not None:
+                self._close([conn])
+            raise
+        return conn
+
+    def put(self, conn):
+        with self._cond:
+            self.in_use -= 1
+            self._idle.append((conn, time.time()))
+            self._cond.notify()
+
+    def discard(self, conn):
+        with self._cond:
+            self.in_use -= 1
+            self.closed += 1
+            self._cond.notify()
+        self._close([conn])
+
+    def stats(self):
+        with self._cond:
+            return {'in_use': self.in_use,
+                    'idle': len(self._idle),
+                    'max_size': self.max_size,
+                    'waits': self.waits,
+                    'wait_time': self.wait_time,
+                    'timeouts': self.timeouts,
+                    'created': self.created,
+                    'closed': self.closed}
+
 
 class Mysql(object):
     _pool = {}
     _credentials = {}
-    _thread = {}
 
     def __init__(self, name=None, host=None, username=None,
-                 password=None, database=None):
-
-        self.thread_id = thread.get_ident()
-
+                 password=None, database=None, pool_min=0, pool_max=0,
+                 pool_timeout=30, pool_idle=300, pool_ping=60):
         if name is not None:
             self.name = name
         else:
@@ -73,11 +181,31 @@ class Mysql(object):
         self.username = username
         self.password = password
         self.database = database
-        self.initialize()
+        self.initialize(pool_min=pool_min, pool_max=pool_max,
+                        pool_timeout=pool_timeout, pool_idle=pool_idle,
+                        pool_ping=pool_ping)
 
-    def initialize(self):
+    def initialize(self, **kwargs):
         if self.name not in self._pool:
-            self._pool[self.name] = Queue(maxsize=0)
+            with lock:
+                if self.name not in self._pool:
+                    name = self.name
+                    credentials = self._credentials
+
+                    def _connect():
+                        c = credentials[name]
+                        return connect(c.get('host', '127.0.0.1'),
+                                       c.get('username', ''),
+                                       c.get('password', ''),
+                                       c.get('database', ''))
+
+                    self._pool[self.name] = Pool(
+                        _connect,
+                        min_size=kwargs.get('pool_min', 0),
+                        max_size=kwargs.get('pool_max', 0),
+                        timeout=kwargs.get('pool_timeout', 30),
+                        idle=kwargs.get('pool_idle', 300),
+                        ping=kwargs.get('pool_ping', 60))
 
         if self.name not in self._credentials:
             self._credentials[self.name] = {}
@@ -95,81 +223,87 @@ class Mysql(object):
         self.password = self._credentials[self.name].get('password', '')
         self.database = self._credentials[self.name].get('database', '')
 
-        if (self.thread_id in self._thread and
-                self.name in self._thread[self.thread_id]):
-            pass
-        else:
-            if self.thread_id not in self._thread:
-                self._thread[self.thread_id] = {}
-            if self._pool[self.name].empty():
-                conn = connect(self.host,
-                               self.username,
-                               self.password,
-                               self.database)
-                conn.ping(True)
-                cursor = conn.cursor(cursors.DictCursor)
-            else:
-                conn = self._pool[self.name].get(True)
+        if self.name not in self._thread:
+            conn = self._pool[self.name].get()
+            cursor = conn.cursor(cursors.DictCursor)
+            self._thread[self.name] = {}
+            self._thread[self.name]['db'] = conn
+            self._thread[self.name]['cursor'] = cursor
+            self._thread[self.name]['uncommited'] = False
+
+    def _reinitialize(self):
+        # Drop the broken connection from the pool and borrow another.
+        db = self._thread[self.name]['db']
+        del self._thread[self.name]
+        self._pool[self.name].discard(db)
+        self.initialize()
 
-                conn.ping(True)
-                cursor = conn.cursor(cursors.DictCursor)
-            self._thread[self.thread_id][self.name] = {}
-            self._thread[self.thread_id][self.name]['db'] = conn
-            self._thread[self.thread_id][self.name]['cursor'] = cursor
-            self._thread[self.thread_id][self.name]['uncommited'] = False
+    @property
+    def _thread(self):
+        # Connections borrowed by the current request, keyed on name.
+        return request_context.get('mysql', dict)
+
+    @staticmethod
+    def stats(name=None):
+        if name is not None:
+            return nfw.Mysql._pool[name].stats()
+        stats = {}
+        for name in nfw.Mysql._pool:
+            stats[name] = nfw.Mysql._pool[name].stats()
+        return stats
 
     @staticmethod
     def close_all():
-        thread_id = thread.get_ident()
-        if thread_id in nfw.Mysql._thread:
-            for o in nfw.Mysql._thread[thread_id]:
-                db = nfw.Mysql._thread[thread_id][o]['db']
-                uncommited = nfw.Mysql._thread[thread_id][o]['uncommited']
-                if uncommited is True:
-                    rollback(db)
-                    # Autocommit neccessary for next request to start new transactions.
-                    # If not applied select queries will return cached results
-                    commit(db)
-                nfw.Mysql._pool[o].put_nowait(db)
-            del nfw.Mysql._thread[thread_id]
+        borrowed = request_context.pop('mysql')
+        if borrowed is not None:
+            for o in borrowed:
+                db = borrowed[o]['db']
+                uncommited = borrowed[o]['uncommited']
+                try:
+                    if uncommited is True:
+                        rollback(db)
+                        # Autocommit neccessary for next request to start new transactions.
+                        # If not applied select queries will return cached results
+                        commit(db)
+                    nfw.Mysql._pool[o].put(db)
+                except MySQLdb.OperationalError as e:
+                    log.error("mysql error (%s)" % (e,))
+                    nfw.Mysql._pool[o].discard(db)
 
     def close(self):
-        try:
-            if (self.thread_id in self._thread and
-                    self.name in self._thread[self.thread_id]):
-                db = self._thread[self.thread_id][self.name]['db']
-                uncommited = self._thread[self.thread_id][self.name]['uncommited']
+        if self.name in self._thread:
+            db = self._thread[self.name]['db']
+            uncommited = self._thread[self.name]['uncommited']
+            del self._thread[self.name]
+            try:
                 if uncommited is True:
                     rollback(db)
-                self._pool[self.name].put_nowait(db)
-                del self._thread[self.thread_id][self.name]
-        except MySQLdb.OperationalError as e:
-            del self._thread[self.thread_id][self.name]
-            log.error("mysql error" % (e))
+                self._pool[self.name].put(db)
+            except MySQLdb.OperationalError as e:
+                log.error("mysql error (%s)" % (e,))
+                self._pool[self.name].discard(db)
 
     def last_row_id(self):
         try:
-            cursor = self._thread[self.thread_id][self.name]['cursor']
+            cursor = self._thread[self.name]['cursor']
             return cursor.lastrowid
         except MySQLdb.OperationalError as e:
             log.error("mysql error, attempt to re-initialize (%s)" % (e))
-            del self._thread[self.thread_id][self.name]
-            self.initialize()
+            self._reinitialize()
             return None
 
     def last_row_count(self):
         try:
-            cursor = self._thread[self.thread_id][self.name]['cursor']
+            cursor = self._thread[self.name]['cursor']
             return cursor.rowcount
         except MySQLdb.OperationalError as e:
             log.error("mysql error, attempt to re-initialize (%s)" % (e))
-            del self._thread[self.thread_id][self.name]
-            self.initialize()
+            self._reinitialize()
             return None
 
     def _ping(self):
         try:
-            cursor = self._thread[self.thread_id][self.name]['cursor']
+            cursor = self._thread[self.name]['cursor']
             execute(cursor, "SELECT VERSION()")
             return True
         except:
@@ -177,18 +311,31 @@ class Mysql(object):
 
     def execute(self, query=None, params=None):
         try:
-            cursor = self._thread[self.thread_id][self.name]['cursor']
+            cursor = self._thread[self.name]['cursor']
             result = execute(cursor, query, params)
-            self._thread[self.thread_id][self.name]['uncommited'] = True
+            self._thread[self.name]['uncommited'] = True
             return result
         except MySQLdb.OperationalError as e:
-            if self._ping is False:
+            if self._ping() is False:
                 log.error("mysql error, attempt to re-initialize (%s)" % (e))
-                del self._thread[self.thread_id][self.name]
-                self.initialize()
-                return execute(self, query, params)
+                self._reinitialize()
+                return self.execute(query, params)
             else:
-                raise MySQLdb.OperationalError(e)
+                raise
+
+    def iterate(self, query=None, params=None, batch_size=1000):
+        # Stream rows through an unbuffered server side cursor, holding at
+        # most batch_size rows in memory. The connection cannot be used for
+        # other queries until the iterator is exhausted or closed.
+        db = self._thread[self.name]['db']
+        try:
+            cursor = db.cursor(cursors.SSDictCursor)
+            self._thread[self.name]['uncommited'] = True
+        except MySQLdb.OperationalError as e:
+            log.error("mysql error, attempt to re-initialize (%s)" % (e))
+            self._reinitialize()
+            return self.iterate(query, params, batch_size)
+        return iterate(cursor, query, params, batch_size)
 
     def lock(self, table, write=True):
         try:
@@ -196,56 +343,52 @@ class Mysql(object):
                 lock = "WRITE"
             else:
                 lock = "READ"
-            cursor = self._thread[self.thread_id][self.name]['cursor']
+            cursor = self._thread[self.name]['cursor']
             query = "LOCK TABLES %s %s" % (table, lock)
             result = execute(cursor, query)
             return result
         except MySQLdb.OperationalError as e:
-            if self._ping is False:
+            if self._ping() is False:
                 log.error("mysql error, attempt to re-initialize (%s)" % (e))
-                del self._thread[self.thread_id][self.name]
-                self.initialize()
-                return lock(self, table, write)
+                self._reinitialize()
+                return self.lock(table, write)
             else:
-                raise MySQLdb.OperationalError(e)
+                raise
 
     def unlock(self):
         try:
-            cursor = self._thread[self.thread_id][self.name]['cursor']
+            cursor = self._thread[self.name]['cursor']
             query = "UNLOCK TABLES"
             result = execute(cursor, query)
             return result
         except MySQLdb.OperationalError as e:
-            if self._ping is False:
+            if self._ping() is False:
                 log.error("mysql error, attempt to re-initialize (%s)" % (e))
-                del self._thread[self.thread_id][self.name]
-                self.initialize()
-                return unlock(self, table)
+                self._reinitialize()
+                return self.unlock()
             else:
-                raise MySQLdb.OperationalError(e)
+                raise
 
     def commit(self):
         try:
-            db = self._thread[self.thread_id][self.name]['db']
-            if self._thread[self.thread_id][self.name]['uncommited'] is True:
+            db = self._thread[self.name]['db']
+            if self._thread[self.name]['uncommited'] is True:
                 commit(db)
-                self._thread[self.thread_id][self.name]['uncommited'] = False
+                self._thread[self.name]['uncommited'] = False
         except MySQLdb.OperationalError as e:
             log.error("mysql error, attempt to re-initialize (%s)" % (e))
-            del self._thread[self.thread_id][self.name]
-            self.initialize()
+            self._reinitialize()
             self.commit()
 
     def rollback(self):
         try:
-            db = self._thread[self.thread_id][self.name]['db']
+            db = self._thread[self.name]['db']
             rollback(db)
             commit(db)
-            self._thread[self.thread_id][self.name]['uncommited'] = False
+            self._thread[self.name]['uncommited'] = False
         except MySQLdb.OperationalError as e:
             log.error("mysql error, attempt to re-initialize (%s)" % (e))
-            del self._thread[self.thread_id][self.name]
-            self.initialize()
+            self._reinitialize()
             self.rollback()
 
 
@@ -290,6 +433,10 @@ def connect(host, username, password, database):
 
 
 def execute(cursor, query=None, params=None):
+    if not log.isEnabledFor(logging.DEBUG):
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
     timer = nfw.utils.timer()
 
     log_query = _log_query(query, params)
@@ -306,7 +453,31 @@ def execute(cursor, query=None, params=None):
     return result
 
 
+def iterate(cursor, query=None, params=None, batch_size=1000):
+    timer = nfw.utils.timer()
+    count = 0
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            count += len(rows)
+            for row in rows:
+                yield row
+    finally:
+        cursor.close()
+        if log.isEnabledFor(logging.DEBUG):
+            timer = nfw.utils.timer(timer)
+            log.debug("SQL Stream %s (ROWS: %s) (DURATION: %s)" %
+                      (_log_query(query, params), count, timer))
+
+
 def commit(db):
+    if not log.isEnabledFor(logging.DEBUG):
+        db.commit()
+        return
+
     timer = nfw.utils.timer()
     db.commit()
     timer = nfw.utils.timer(timer)
@@ -327,6 +498,10 @@ def commit(db):
 
 
 def rollback(db):
+    if not log.isEnabledFor(logging.DEBUG):
+        db.rollback()
+        return
+
     timer = nfw.utils.timer()
     db.rollback()
     timer = nfw.utils.timer(timer)
@@ -401,3 +576,6 @@ class Testing():
                 raise Exception("Values not matched")
 
         return q.get('result', [])
+
+    def iterate(self, query, values=None, batch_size=1000):
+        return iter(self.execute(query, values))
@@ -34,18 +34,74 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import atexit
 import logging
+import threading
 
 import nfw
 import redis as rd
 
 log = logging.getLogger(__name__)
 
+# One connection pool and client per (server, port, db) in this process.
+# Clients are thread safe and the pool re-creates its connections after
+# a fork, so they are shared by all requests.
+_clients = {}
+_lock = threading.Lock()
+
+
+def _pool(redis_config, host, port, db):
+    kwargs = {}
+    kwargs['host'] = host
+    kwargs['port'] = port
+    kwargs['db'] = db
+
+    socket_timeout = redis_config.get('socket_timeout')
+    if socket_timeout is not None:
+        kwargs['socket_timeout'] = float(socket_timeout)
+    connect_timeout = redis_config.get('socket_connect_timeout')
+    if connect_timeout is not None:
+        kwargs['socket_connect_timeout'] = float(connect_timeout)
+    health_check = redis_config.get('health_check_interval')
+    if health_check is not None:
+        kwargs['health_check_interval'] = int(health_check)
+
+    max_connections = redis_config.get('max_connections')
+    if max_connections is not None:
+        # Block for a free connection instead of failing when the pool
+        # is exhausted.
+        timeout = float(redis_config.get('pool_timeout', 20))
+        return rd.BlockingConnectionPool(max_connections=int(max_connections),
+                                         timeout=timeout,
+                                         **kwargs)
+    else:
+        return rd.ConnectionPool(**kwargs)
+
 
 def redis(config):
     redis_config = config.get('redis')
     host = redis_config.get('server', 'localhost')
-    port = redis_config.get('port', 6379)
-    db = redis_config.get('db', 0)
+    port = int(redis_config.get('port', 6379))
+    db = int(redis_config.get('db', 0))
+
+    key = (host, port, db)
+    try:
+        return _clients[key]
+    except KeyError:
+        with _lock:
+            if key not in _clients:
+                log.debug("Creating Redis connection pool" +
+                          " (server=%s,port=%s,db=%s)" % key)
+                pool = _pool(redis_config, host, port, db)
+                _clients[key] = rd.StrictRedis(connection_pool=pool)
+            return _clients[key]
+
+
+def close_all():
+    with _lock:
+        for key in _clients:
+            _clients[key].connection_pool.disconnect()
+        _clients.clear()
+
 
-    return rd.StrictRedis(host=host, port=port, db=db)
+atexit.register(close_all)
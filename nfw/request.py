@@ -35,14 +35,19 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import sys
+import io
 import logging
 import cgi
+import zlib
+import tempfile
 if sys.version[0] == '2':
     import urlparse
     from urllib import quote
+    from urllib import unquote as unquote_to_bytes
 else:
     from urllib import parse as urlparse
     from urllib.parse import quote
+    from urllib.parse import unquote_to_bytes
 
 import nfw
 
@@ -51,73 +56,151 @@ log = logging.getLogger(__name__)
 
 
 class Request(object):
+    # Attributes live in slots, public ones are read-only properties except
+    # method, args, view and policy which the router and wsgi set.
+    __slots__ = ('_context', '_app_context', '_config', '_router',
+                 '_logger', '_session', '_environ', '_method', '_app',
+                 '_request_id', '_content_length', '_view', '_input',
+                 '_read_field', '_read_file', '_post', '_json',
+                 '_json_loaded', 'args', 'view', 'policy')
+
     def __init__(self, environ, config, session, router, logger, app):
-        super(Request, self).__setattr__('context', {})
-        super(Request, self).__setattr__('app_context', app.context)
-        super(Request, self).__setattr__('config', config)
-        super(Request, self).__setattr__('router', router)
-        super(Request, self).__setattr__('logger', logger)
-        super(Request, self).__setattr__('session', session)
-        super(Request, self).__setattr__('environ', environ)
-        super(Request, self).__setattr__('method', environ['REQUEST_METHOD'])
-        super(Request, self).__setattr__('app', environ['SCRIPT_NAME'])
-        super(Request, self).__setattr__('headers', nfw.Headers())
-        super(Request, self).__setattr__('request_id', nfw.random_id(16))
-
-        self.logger.set_extra('(REQUEST:%s)' % (self.request_id))
-        self.logger.append_extra('(REMOTE_ADDR:%s)' % (self.environ['REMOTE_ADDR']))
-        script_filename = self.environ.get('SCRIPT_FILENAME', 'None')
-        self.logger.append_extra('(WSGI:%s)' % (script_filename,))
-
-        for p in environ:
-            n = p.replace('.', '_').lower()
-            if len(p) > 5 and 'HTTP_' in p:
-                hk = p.replace('HTTP_', '')
-                self.headers[hk] = environ[p]
+        self._context = {}
+        self._app_context = app.context
+        self._config = config
+        self._router = router
+        self._logger = logger
+        self._session = session
+        self._environ = environ
+        self._method = environ['REQUEST_METHOD']
+        self._app = environ['SCRIPT_NAME']
+        self._request_id = nfw.random_id(16)
+
+        logger.set_extra('(REQUEST:%s)' % (self._request_id))
+        logger.append_extra('(REMOTE_ADDR:%s)' % (environ['REMOTE_ADDR']))
+        script_filename = environ.get('SCRIPT_FILENAME', 'None')
+        logger.append_extra('(WSGI:%s)' % (script_filename,))
+
+        # Headers, query and cookies are parsed on first use.
+        self._view = nfw.EnvironView.get(environ)
         try:
-            super(Request, self).__setattr__('content_length',
-                                             int(environ.get('CONTENT_LENGTH',
-                                                 0)))
+            self._content_length = int(environ.get('CONTENT_LENGTH', 0))
             self._input = environ['wsgi.input']
         except (ValueError):
-            super(Request, self).__setattr__('content_length', 0)
+            self._content_length = 0
             self._input = None
 
         self._read_field = False
         self._read_file = False
         self._post = None
-        query = urlparse.parse_qs(self.environ['QUERY_STRING'])
-        super(Request, self).__setattr__('query', query)
-
-    def __setattr__(self, name, value):
-        if name == 'method':
-            super(Request, self).__setattr__(name, value.upper())
-        elif name[0] == '_':
-            super(Request, self).__setattr__(name, value)
-        elif name == 'args' or name == 'view' or name == 'policy':
-            super(Request, self).__setattr__(name, value)
-        elif hasattr(self, name):
-            raise AttributeError("'request' object can't rebind" +
-                                 " attribute '%s'" % (name,))
-        else:
-            raise AttributeError("'request' object can't bind" +
-                                 " attribute '%s'" % (name,))
+        self._json = None
+        self._json_loaded = False
 
     def __getattr__(self, name):
-        name = name.lower()
-        if name in self.__dict__:
-            return self.__dict__[name]
-        elif name == 'post':
-            if self._post is None:
-                if self._read_file is False:
-                    self._post = Post(self._input, self.environ)
-                else:
-                    raise Exception("'You cannot use post after" +
-                                    " reading from body'")
-            return self._post
-        else:
-            raise AttributeError("'request' object has no" +
-                                 " attribute '%s'" % (name,))
+        # Only reached for unknown names, attributes are case-insensitive.
+        lower = name.lower()
+        if lower != name:
+            return getattr(self, lower)
+        raise AttributeError("'request' object has no" +
+                             " attribute '%s'" % (name,))
+
+    @property
+    def context(self):
+        return self._context
+
+    @property
+    def app_context(self):
+        return self._app_context
+
+    @property
+    def config(self):
+        return self._config
+
+    @property
+    def router(self):
+        return self._router
+
+    @property
+    def logger(self):
+        return self._logger
+
+    @property
+    def session(self):
+        return self._session
+
+    @property
+    def environ(self):
+        return self._environ
+
+    @property
+    def app(self):
+        return self._app
+
+    @property
+    def request_id(self):
+        return self._request_id
+
+    @property
+    def content_length(self):
+        return self._content_length
+
+    @property
+    def method(self):
+        return self._method
+
+    @method.setter
+    def method(self, value):
+        self._method = value.upper()
+
+    @property
+    def headers(self):
+        return self._view.headers
+
+    @property
+    def query(self):
+        return self._view.query
+
+    @property
+    def cookies(self):
+        return self._view.cookies
+
+    @property
+    def post(self):
+        if self._post is None:
+            if self._read_file is False:
+                app_config = self._config.get('application')
+                self._read_field = True
+                self._post = Post(
+                    self._input, self._environ,
+                    max_body=int(app_config.get('max_body_size', 0)),
+                    max_part=int(app_config.get('max_part_size', 0)),
+                    spool_size=int(app_config.get('upload_spool_size',
+                                                  1048576)),
+                    max_inflate=int(app_config.get('max_inflate_size',
+                                                   10485760)))
+            else:
+                raise Exception("'You cannot use post after" +
+                                " reading from body'")
+        return self._post
+
+    @property
+    def json(self):
+        if self._read_field is True:
+            raise Exception("'You cannot use json after" +
+                            " accessing post'")
+        if self._json_loaded is False:
+            if self._read_file is True:
+                raise Exception("'You cannot use json after" +
+                                " reading from body'")
+            self._read_file = True
+            app_config = self._config.get('application')
+            max_body = _limit(int(app_config.get('max_body_size', 0)),
+                              int(app_config.get('max_json_size', 10485760)))
+            self._json = _json(self._input, self._environ, max_body,
+                               int(app_config.get('max_inflate_size',
+                                                  10485760)))
+            self._json_loaded = True
+        return self._json
 
     def read(self, size=0):
         if self._read_field is False:
@@ -277,21 +360,332 @@ class Request(object):
             return False
 
 
+class Part(object):
+    # Field of a posted form. The content is kept in .file, spooled to disk
+    # for uploads over the spool size, and .value reads all of it.
+    def __init__(self, name, filename=None, type=None, headers=None,
+                 file=None, value=None):
+        self.name = name
+        self.filename = filename
+        self.type = type
+        self.headers = headers or {}
+        self._file = file
+        self._value = value
+
+    @property
+    def file(self):
+        if self._file is None:
+            self._file = io.BytesIO(nfw.utils.if_unicode_to_utf8(self._value))
+        return self._file
+
+    @property
+    def value(self):
+        if self._value is not None:
+            return self._value
+        self.file.seek(0)
+        value = self.file.read()
+        self.file.seek(0)
+        if self.filename is None and sys.version[0] != '2':
+            value = value.decode('utf-8', 'replace')
+        return value
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def __iter__(self):
+        # Stream the content in chunks.
+        self.file.seek(0)
+        return iter(lambda: self.file.read(65536), b'')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def __repr__(self):
+        return "Part(%r, %r)" % (self.name, self.filename)
+
+
+class _Reader(object):
+    # Reads the request body in bounded chunks, never past Content-Length
+    # and never more than max_body bytes.
+    def __init__(self, fp, length, max_body):
+        self._fp = fp
+        self._remaining = length
+        self._max_body = max_body
+        self._read = 0
+
+    def read(self, size):
+        if self._remaining is not None:
+            size = min(size, self._remaining)
+        if size <= 0:
+            return b''
+        data = self._fp.read(size)
+        self._read += len(data)
+        if self._remaining is not None:
+            self._remaining -= len(data)
+        if self._max_body and self._read > self._max_body:
+            raise nfw.HTTPPayloadTooLarge('Request body exceeds %s bytes'
+                                          % (self._max_body,))
+        return data
+
+
+class _Inflate(object):
+    # Decompresses a gzip encoded body as it is read, enforcing max_body
+    # on the decompressed size.
+    def __init__(self, reader, max_body):
+        self._reader = reader
+        self._max_body = max_body
+        self._total = 0
+        self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def read(self, size):
+        while True:
+            data = self._d.unconsumed_tail
+            if not data:
+                data = self._reader.read(size)
+                if not data:
+                    return self._d.flush()
+            try:
+                out = self._d.decompress(data, size)
+            except zlib.error:
+                raise nfw.HTTPBadRequest('Bad request',
+                                         'Invalid gzip request body')
+            if out:
+                self._total += len(out)
+                if self._max_body and self._total > self._max_body:
+                    raise nfw.HTTPPayloadTooLarge(
+                        'Request body exceeds %s bytes' % (self._max_body,))
+                return out
+
+
+def _limit(*limits):
+    # Smallest of the size limits, where 0 is unlimited.
+    limits = [limit for limit in limits if limit]
+    if len(limits) == 0:
+        return 0
+    return min(limits)
+
+
+def _reader(fp, environ, max_body, max_inflate=10485760):
+    # Reader of the request body honouring Content-Length, Content-Encoding
+    # and max_body, or None when there is no body. A compressed body is
+    # also limited to max_inflate bytes once decompressed, since a small
+    # request may otherwise expand without bound.
+    try:
+        length = int(environ.get('CONTENT_LENGTH'))
+    except (TypeError, ValueError):
+        length = None
+    if max_body and length is not None and length > max_body:
+        # Refuse before reading anything.
+        raise nfw.HTTPPayloadTooLarge('Request body exceeds %s bytes'
+                                      % (max_body,))
+    encoding = environ.get('HTTP_CONTENT_ENCODING', 'identity').lower()
+    if encoding not in ('identity', 'gzip', 'x-gzip'):
+        raise nfw.HTTPUnsupportedMediaType('Unsupported content encoding %s'
+                                           % (encoding,))
+    if fp is None:
+        return None
+    reader = _Reader(fp, length, max_body)
+    if encoding != 'identity':
+        reader = _Inflate(reader, _limit(max_body, max_inflate))
+    return reader
+
+
+def _read_all(reader, chunk_size=65536):
+    body = []
+    while True:
+        data = reader.read(chunk_size)
+        if not data:
+            break
+        body.append(data)
+    return b''.join(body)
+
+
+def _json(fp, environ, max_body, max_inflate=10485760):
+    reader = _reader(fp, environ, max_body, max_inflate)
+    if reader is None:
+        return None
+    body = _read_all(reader)
+    if len(body) == 0:
+        return None
+    try:
+        return nfw.utils.fastjson.loads(body)
+    except ValueError as e:
+        raise nfw.HTTPBadRequest('Bad request',
+                                 'Invalid JSON request body (%s)' % (e,))
+
+
 class Post(object):
-    def __init__(self, fp, environ):
-        self._cgi = cgi.FieldStorage(fp=fp, environ=environ)
+    def __init__(self, fp, environ, max_body=0, max_part=0,
+                 spool_size=1048576, chunk_size=65536, max_inflate=10485760):
+        self._fields = {}
+        self._order = []
+        self._max_part = max_part
+        self._spool_size = spool_size
+        self._chunk_size = chunk_size
+
+        content_type, params = cgi.parse_header(
+            environ.get('CONTENT_TYPE', ''))
+        reader = _reader(fp, environ, max_body, max_inflate)
+        if reader is not None:
+            if content_type == 'multipart/form-data':
+                boundary = params.get('boundary')
+                if not boundary:
+                    raise nfw.HTTPBadRequest('Bad request',
+                                             'Missing multipart boundary')
+                self._multipart(reader, boundary.encode('utf-8'))
+            elif content_type == 'application/x-www-form-urlencoded':
+                self._urlencoded(reader)
+
+        self._query(environ.get('QUERY_STRING', ''))
+
+    def _add(self, part):
+        if part.name not in self._fields:
+            self._fields[part.name] = []
+            self._order.append(part.name)
+        self._fields[part.name].append(part)
+
+    def _query(self, query_string):
+        # Query string fields are included as cgi.FieldStorage did, but
+        # never replace a field of the same name from the body.
+        body = set(self._fields)
+        for name, value in urlparse.parse_qsl(query_string,
+                                              keep_blank_values=True):
+            if name not in body:
+                self._add(Part(name, value=value))
+
+    def _urlencoded(self, reader):
+        # Split on & and = directly instead of going through cgi.
+        body = _read_all(reader, self._chunk_size)
+        for field in body.split(b'&'):
+            if not field:
+                continue
+            name, sep, value = field.partition(b'=')
+            name = unquote_to_bytes(name.replace(b'+', b' '))
+            value = unquote_to_bytes(value.replace(b'+', b' '))
+            if sys.version[0] != '2':
+                name = name.decode('utf-8', 'replace')
+                value = value.decode('utf-8', 'replace')
+            self._add(Part(name, value=value))
+
+    def _sink(self, filename):
+        if filename is None:
+            return io.BytesIO()
+        return tempfile.SpooledTemporaryFile(max_size=self._spool_size)
+
+    def _multipart(self, reader, boundary):
+        # Incremental parser holding at most one read chunk plus the
+        # length of a delimiter in memory, part bodies are written to
+        # their sink as they arrive.
+        delimiter = b'\r\n--' + boundary
+        # The first delimiter is not preceded by a line break.
+        buf = b'\r\n'
+        state = 'preamble'
+        part = None
+        size = 0
+        eof = False
+        while True:
+            progress = True
+            while progress:
+                progress = False
+                if state == 'preamble':
+                    pos = buf.find(delimiter)
+                    if pos == -1:
+                        buf = buf[-len(delimiter):]
+                    else:
+                        buf = buf[pos + len(delimiter):]
+                        state = 'delimiter'
+                        progress = True
+                elif state == 'delimiter':
+                    if len(buf) >= 2:
+                        if buf[:2] == b'--':
+                            return
+                        state = 'headers'
+                        progress = True
+                elif state == 'headers':
+                    pos = buf.find(b'\r\n\r\n')
+                    if pos != -1:
+                        part = self._part(buf[:pos])
+                        buf = buf[pos + 4:]
+                        size = 0
+                        state = 'body'
+                        progress = True
+                    elif len(buf) > 16384:
+                        raise nfw.HTTPBadRequest('Bad request',
+                                                 'Multipart headers too long')
+                elif state == 'body':
+                    pos = buf.find(delimiter)
+                    if pos == -1:
+                        # Keep enough to find a delimiter split over reads.
+                        keep = len(delimiter)
+                        data, buf = buf[:-keep], buf[-keep:]
+                    else:
+                        data, buf = buf[:pos], buf[pos + len(delimiter):]
+                    size += len(data)
+                    if self._max_part and size > self._max_part:
+                        part.close()
+                        raise nfw.HTTPPayloadTooLarge(
+                            'Form field %s exceeds %s bytes'
+                            % (part.name, self._max_part))
+                    part.file.write(data)
+                    if pos != -1:
+                        part.file.seek(0)
+                        self._add(part)
+                        state = 'delimiter'
+                        progress = True
+
+            if eof:
+                if state == 'preamble':
+                    return
+                if part is not None and state == 'body':
+                    part.close()
+                raise nfw.HTTPBadRequest('Bad request',
+                                         'Truncated multipart body')
+            data = reader.read(self._chunk_size)
+            if data:
+                buf += data
+            else:
+                eof = True
+
+    def _part(self, raw):
+        headers = {}
+        for line in raw.split(b'\r\n'):
+            if b':' in line:
+                k, v = line.split(b':', 1)
+                headers[k.strip().lower().decode('latin-1')] = \
+                    v.strip().decode('utf-8', 'replace')
+        disposition, params = cgi.parse_header(
+            headers.get('content-disposition', ''))
+        filename = params.get('filename')
+        return Part(params.get('name'), filename=filename,
+                    type=headers.get('content-type'), headers=headers,
+                    file=self._sink(filename))
 
     def __getitem__(self, key):
-        return self._cgi[key]
+        parts = self._fields[key]
+        if len(parts) == 1:
+            return parts[0]
+        return parts
 
     def __contains__(self, key):
-        return key in self._cgi
+        return key in self._fields
 
     def __iter__(self):
-        return iter(self._cgi)
+        return iter(self._order)
+
+    def __len__(self):
+        return len(self._order)
+
+    def keys(self):
+        return list(self._order)
+
+    def getlist(self, k):
+        if k in self._fields:
+            return [part.value for part in self._fields[k]]
+        return []
 
     def get(self, k, d=None):
-        if k in self._cgi:
-            return ",".join(self._cgi.getlist(k))
+        if k in self._fields:
+            return ",".join(self.getlist(k))
         else:
             return d
@@ -34,19 +34,80 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import io
+import os
 import sys
+import re
+import mmap
 import logging
-
-if sys.version[0] == '2':
-    from StringIO import StringIO
-else:
-    from io import StringIO
+import mimetypes
+import email.utils
 
 import nfw
 
 log = logging.getLogger(__name__)
 
+_range = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _byte_range(header, size):
+    # Single byte range of a Range header as (start, end) inclusive. None
+    # when the whole file should be sent, False when not satisfiable.
+    if header is None:
+        return None
+    match = _range.match(header.strip())
+    if match is None:
+        # Malformed or multiple ranges, which may be ignored.
+        return None
+    start, end = match.groups()
+    if start == '' and end == '':
+        return None
+    if start == '':
+        length = int(end)
+        if length == 0:
+            return False
+        return (max(size - length, 0), size - 1)
+    start = int(start)
+    if start >= size:
+        return False
+    if end == '' or int(end) >= size:
+        return (start, size - 1)
+    if int(end) < start:
+        return None
+    return (start, int(end))
+
+
+class _FileStream(object):
+    # Fallback when the server has no wsgi.file_wrapper, slices of a
+    # memory map avoid copying through a read buffer.
+    def __init__(self, f, start, length, chunk_size):
+        self._f = f
+        self._start = start
+        self._length = length
+        self._chunk_size = chunk_size
+        self._iter = None
+
+    def __iter__(self):
+        self._iter = self._read()
+        return self._iter
+
+    def _read(self):
+        if self._length == 0:
+            return
+        m = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            pos = self._start
+            end = self._start + self._length
+            while pos < end:
+                yield m[pos:min(pos + self._chunk_size, end)]
+                pos += self._chunk_size
+        finally:
+            m.close()
+
+    def close(self):
+        if self._iter is not None:
+            self._iter.close()
+        self._f.close()
+
 
 def http_moved_permanently(url, req, resp):
     resp.clear()
@@ -99,58 +160,181 @@ def http_permanent_redirect(url, req, resp):
 
 
 class Response(object):
-    _attributes = ['status']
+    # The body is kept as the list of byte strings written, which is
+    # handed to the server as is, or as an iterable registered with
+    # stream().
+    __slots__ = ('status', '_headers', '_chunks', '_stream', '_pos',
+                 '_content_length', '_req', '_file_wrapper')
 
     def __init__(self, req=None):
         self.status = nfw.HTTP_200
-        super(Response, self).__setattr__('headers', nfw.Headers(request=False))
-        self.headers['Content-Type'] = nfw.TEXT_HTML
-        super(Response, self).__setattr__('_io', StringIO())
-        super(Response, self).__setattr__('content_length', 0)
-        super(Response, self).__setattr__('_req', req)
-        self.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        self.headers['Progma'] = 'no-cache'
-        self.headers['Expires'] = 0
-
-    def __setattr__(self, name, value):
-        if name in self._attributes:
-            super(Response, self).__setattr__(name, value)
-        elif name == 'body':
-            self.clear()
-            super(Response, self).__setattr__('_io', StringIO())
-            self.write(value)
-        else:
-            AttributeError("'response' object can't bind" +
-                           " attribute '%s'" % (name,))
+        self._headers = headers = nfw.ResponseHeaders()
+        self._chunks = []
+        self._stream = None
+        self._pos = 0
+        self._content_length = 0
+        self._req = req
+        self._file_wrapper = False
+        headers['Content-Type'] = nfw.TEXT_HTML
+        headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+        headers['Progma'] = 'no-cache'
+        headers['Expires'] = 0
+
+    @property
+    def headers(self):
+        return self._headers
+
+    @property
+    def content_length(self):
+        return self._content_length
+
+    @property
+    def body(self):
+        return self._getvalue()
+
+    @body.setter
+    def body(self, value):
+        self.clear()
+        self.write(value)
+
+    def _getvalue(self):
+        if len(self._chunks) > 1:
+            # Join once, later reads use the joined chunk.
+            self._chunks = [b''.join(self._chunks)]
+        if len(self._chunks) == 0:
+            return b''
+        return self._chunks[0]
 
     def seek(self,position):
-        self._io.seek(position)
+        self._pos = position
 
     def read(self, size=0):
+        data = self._getvalue()
         if size == 0:
-            return self._io.read()
+            end = len(data)
         else:
-            return self._io.read(size)
+            end = self._pos + size
+        chunk = data[self._pos:end]
+        self._pos += len(chunk)
+        return chunk
 
     def readline(self, size=0):
-        if size == 0:
-            return self._io.readline()
+        data = self._getvalue()
+        end = data.find(b'\n', self._pos)
+        if end == -1:
+            end = len(data)
         else:
-            return self._io.readline(size)
+            end += 1
+        if size != 0:
+            end = min(end, self._pos + size)
+        chunk = data[self._pos:end]
+        self._pos += len(chunk)
+        return chunk
 
     def write(self, data):
+        if self._stream is not None:
+            raise nfw.Error("Cannot write to a streaming response")
         data = nfw.utils.if_unicode_to_utf8(data)
-        super(Response, self).__setattr__('content_length',
-                                          len(data)+self.content_length)
-        self._io.write(data)
+        self._content_length += len(data)
+        self._chunks.append(data)
+        self._pos = self._content_length
+
+    def stream(self, iterable, content_length=None):
+        # Send the body from an iterable of strings as the server consumes
+        # it. Content-Length is only sent when given.
+        self.clear()
+        self._stream = iterable
+        self._content_length = content_length
+
+    def send_file(self, path, content_type=None, chunk_size=65536):
+        # Send a file as the body, with sendfile(2) where the server's
+        # wsgi.file_wrapper supports it. Honours a single byte Range and
+        # If-Modified-Since.
+        try:
+            st = os.stat(path)
+        except OSError:
+            raise nfw.HTTPNotFound(description=path)
+        size = st.st_size
+        mtime = int(st.st_mtime)
+
+        if self._req is not None:
+            environ = self._req.environ
+        else:
+            environ = {}
+
+        if content_type is None:
+            content_type = mimetypes.guess_type(path)[0]
+            if content_type is None:
+                content_type = nfw.APPLICATION_OCTET_STREAM
+        self.headers['Content-Type'] = content_type
+        self.headers['Last-Modified'] = email.utils.formatdate(mtime,
+                                                               usegmt=True)
+        self.headers['Accept-Ranges'] = 'bytes'
+
+        since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if since is not None:
+            since = email.utils.parsedate_tz(since)
+            if since is not None and mtime <= email.utils.mktime_tz(since):
+                self.status = nfw.HTTP_304
+                self.clear()
+                return
+
+        byte_range = _byte_range(environ.get('HTTP_RANGE'), size)
+        if byte_range is False:
+            self.status = nfw.HTTP_416
+            self.headers['Content-Range'] = 'bytes */%s' % (size,)
+            self.clear()
+            return
+
+        f = open(path, 'rb')
+        if byte_range is None:
+            start = 0
+            length = size
+            file_wrapper = environ.get('wsgi.file_wrapper')
+            if file_wrapper is not None:
+                self.stream(file_wrapper(f, chunk_size),
+                            content_length=length)
+                self._file_wrapper = True
+                return
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            self.status = nfw.HTTP_206
+            self.headers['Content-Range'] = 'bytes %s-%s/%s' % (start, end,
+                                                                size)
+        self.stream(_FileStream(f, start, length, chunk_size),
+                    content_length=length)
+
+    @property
+    def streaming(self):
+        return self._stream is not None
+
+    @property
+    def file_wrapper(self):
+        # The server's wsgi.file_wrapper object set by send_file(). It must
+        # be returned to the server as is for it to use sendfile(2).
+        if self._file_wrapper is True:
+            return self._stream
+        return None
 
     def clear(self):
-        super(Response, self).__setattr__('content_length', 0)
-        super(Response, self).__setattr__('_io', StringIO())
+        # A replaced stream, such as an open file, is released here as the
+        # server will only close the final one.
+        self.close()
+        self._content_length = 0
+        del self._chunks[:]
+        self._stream = None
+        self._pos = 0
+        self._file_wrapper = False
 
     def __iter__(self):
-        self._io.seek(0)
-        return ResponseIoStream(self._io)
+        if self._stream is not None:
+            return ResponseIoStream(self._stream)
+        return iter(self._chunks)
+
+    def close(self):
+        if hasattr(self._stream, 'close'):
+            self._stream.close()
 
     def view(self, url, method):
         self.clear()
@@ -161,13 +345,7 @@ class Response(object):
         http_see_other(url, self._req, self)
 
 
-def ResponseIoStream(f, chunk_size=None):
-    '''Genereator to buffer chunks'''
-    while True:
-        if chunk_size is None:
-            chunk = f.read()
-        else:
-            chunk = f.read(chunk_size)
-        if not chunk:
-            break
+def ResponseIoStream(iterable):
+    '''Generator encoding chunks of a streamed body'''
+    for chunk in iterable:
         yield nfw.utils.if_unicode_to_utf8(chunk)
@@ -35,10 +35,6 @@ from __future__ import unicode_literals
 import sys
 import logging
 import re
-if sys.version[0] == '2':
-    import thread
-else:
-    import _thread as thread
 
 try:
     # python 3
@@ -54,11 +50,10 @@ except ImportError:
     from urllib import urlencode
 
 import nfw
+from nfw.utils import request_context
 
 log = logging.getLogger(__name__)
 
-curl_sessions = {}
-
 
 def _debug(debug_type, debug_msg):
     log.debug("(%d): %s" % (debug_type, debug_msg))
@@ -68,8 +63,6 @@ class RestClient(object):
                  ssl_verify_host=True, ssl_cacert=None,
                  ssl_cainfo=None, timeout=30, connect_timeout=2):
 
-        global curl_sessions
-
         if ssl_verify is True:
             if ssl_verify_peer is True:
                 self.ssl_verify_peer = 1
@@ -89,10 +82,7 @@ class RestClient(object):
         self.timeout = timeout
         self.connect_timeout = connect_timeout
 
-        self.thread_id = thread.get_ident()
-        if self.thread_id not in curl_sessions:
-            curl_sessions[self.thread_id] = {}
-        self.curl_session = curl_sessions[self.thread_id]
+        self.curl_session = request_context.get('curl_sessions', dict)
 
     def header_function(self, header_line):
         # HTTP standard specifies that headers are encoded in iso-8859-1.
@@ -236,6 +226,4 @@ class RestClient(object):
     def close_all(self):
         for session in self.curl_session:
             self.curl_session[session].close()
-        self.thread_id = thread.get_ident()
-        curl_sessions[self.thread_id] = {}
-        self.curl_session = curl_sessions[self.thread_id]
+        self.curl_session.clear()
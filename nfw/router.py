@@ -34,76 +34,339 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import sys
 import logging
 import re
 import keyword
+import threading
+from collections import OrderedDict
 
 import nfw
 
 log = logging.getLogger(__name__)
 
+# Placeholder types usable in routes as {name:type}, in order of priority
+# when more than one placeholder competes for the same segment.
+_types = (('int', '-?[0-9]+', int),
+          ('float', '-?[0-9]+(?:\.[0-9]+)?', float),
+          ('str', '[^/]*', None))
+
+_converters = dict((t[0], t) for t in _types)
+_priority = dict((t[0], i) for (i, t) in enumerate(_types))
+_patterns = dict((t[0], re.compile(t[1] + '$')) for t in _types)
+
+# Python 2 limits a compiled expression to 100 groups, so the route table
+# is split over several expressions when needed.
+if sys.version[0] == '2':
+    _max_groups = 99
+else:
+    _max_groups = None
+
+
 def view(uri, method, req, resp):
     req.method = method
     method = method.upper()
-    r = req.router._match(method, uri.strip('/'))
+    r, allowed = req.router._resolve(method, uri.strip('/'))
     if r is not None:
         route, obj_kwargs = r
         method, route, obj, name = route
         obj(req, resp, **obj_kwargs)
+    elif len(allowed) > 0:
+        raise nfw.HTTPMethodNotAllowed(allowed, description=uri)
     else:
         raise nfw.HTTPNotFound(description=uri)
 
-class Router(object):
+
+def _parse(route):
+    segments = []
+    for segment in route.split('/'):
+        if len(segment) > 0 and segment[0] == '{':
+            field = segment.replace('{', '').replace('}', '')
+            if ':' in field:
+                name, kind = field.split(':', 1)
+            else:
+                name, kind = field, 'str'
+            segments.append((name, kind))
+        else:
+            segments.append(segment)
+    return segments
+
+
+class _Node(object):
     def __init__(self):
+        self.static = {}
+        self.dynamic = []
+        self.route = None
+
+    def child(self, segment):
+        if isinstance(segment, tuple):
+            name, kind = segment
+            for k, node in self.dynamic:
+                if k == kind:
+                    return node
+            node = _Node()
+            self.dynamic.append((kind, node))
+            self.dynamic.sort(key=lambda d: _priority[d[0]])
+            return node
+        else:
+            if segment not in self.static:
+                self.static[segment] = _Node()
+            return self.static[segment]
+
+    def lookup(self, uri, depth, values):
+        if depth == len(uri):
+            return self.route
+
+        segment = uri[depth]
+        if segment in self.static:
+            found = self.static[segment].lookup(uri, depth+1, values)
+            if found is not None:
+                return found
+
+        for kind, node in self.dynamic:
+            convert = _converters[kind][2]
+            if convert is None:
+                value = segment
+            elif _patterns[kind].match(segment):
+                value = convert(segment)
+            else:
+                continue
+            values.append(value)
+            found = node.lookup(uri, depth+1, values)
+            if found is not None:
+                return found
+            values.pop()
+
+        return None
+
+
+def _shape_priority(shape):
+    key = []
+    for segment in shape:
+        if isinstance(segment, tuple):
+            key.append((1 + _priority[segment[1]], ''))
+        else:
+            key.append((0, segment))
+    return key
+
+
+def _compile(paths):
+    # Combine route paths into as few expressions as possible. Each path
+    # becomes a named alternative '_N' with its placeholders as '_N_I',
+    # ordered so that the first alternative to match is the same route
+    # the tree would have found.
+    compiled = []
+    alternatives = []
+    table = {}
+    groups = 0
+    shapes = sorted(paths, key=_shape_priority)
+    for (idx, shape) in enumerate(shapes):
+        kinds = []
+        parts = []
+        for segment in shape:
+            if isinstance(segment, tuple):
+                parts.append('(?P<_%s_%s>%s)' % (idx, len(kinds),
+                                                 _converters[segment[1]][1]))
+                kinds.append(segment[1])
+            else:
+                parts.append(re.escape(segment))
+
+        if (_max_groups is not None and len(alternatives) > 0 and
+                groups + len(kinds) + 1 > _max_groups):
+            compiled.append((re.compile('(?:%s)$' % '|'.join(alternatives)),
+                             table))
+            alternatives = []
+            table = {}
+            groups = 0
+
+        alternatives.append('(?P<_%s>%s)' % (idx, '/'.join(parts)))
+        table['_%s' % (idx,)] = (idx, kinds, paths[shape])
+        groups += len(kinds) + 1
+
+    if len(alternatives) > 0:
+        compiled.append((re.compile('(?:%s)$' % '|'.join(alternatives)),
+                         table))
+
+    return compiled
 
+
+class Router(object):
+    def __init__(self, matcher='tree', cache_size=0):
+        if matcher not in ('tree', 'regex'):
+            raise ValueError("Unknown route matcher '%s'." % (matcher,))
+        self.matcher = matcher
         self.routes = []
+        self._tree = {}
+        self._paths = {}
+        self._compiled = None
 
-    def _match(self, method, request_uri):
+        # Bounded LRU of (method, uri) -> (match, allowed methods), which
+        # includes lookups that found nothing.
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._generation = 0
+
+    def compile(self):
+        # Route expressions per method.
+        if self.matcher != 'regex':
+            return
+        compiled = {}
+        methods = {}
+        for shape in self._paths:
+            for method in self._paths[shape]:
+                if method not in methods:
+                    methods[method] = {}
+                methods[method][shape] = {method: self._paths[shape][method]}
+        for method in methods:
+            compiled[method] = _compile(methods[method])
+        self._compiled = compiled
+
+    def _search(self, method, uri):
+        for regex, table in self._compiled.get(method, ()):
+            m = regex.match(uri)
+            if m is not None:
+                idx, kinds, methods = table[m.lastgroup]
+                values = []
+                for (i, kind) in enumerate(kinds):
+                    value = m.group('_%s_%s' % (idx, i))
+                    convert = _converters[kind][2]
+                    if convert is not None:
+                        value = convert(value)
+                    values.append(value)
+                return values, methods
+        return None
+
+    def cache_stats(self):
+        with self._cache_lock:
+            return {'size': len(self._cache),
+                    'max_size': self.cache_size,
+                    'hits': self.hits,
+                    'misses': self.misses}
+
+    def cache_clear(self):
+        with self._cache_lock:
+            self._cache.clear()
+            self._generation += 1
+
+    def _resolve(self, method, request_uri):
+        if self.cache_size <= 0:
+            return self._lookup(method, request_uri)
+
+        key = (method, request_uri)
+        with self._cache_lock:
+            cached = self._cache.pop(key, None)
+            if cached is not None:
+                self._cache[key] = cached
+                self.hits += 1
+            else:
+                self.misses += 1
+            generation = self._generation
+
+        if cached is None:
+            cached = self._lookup(method, request_uri)
+            with self._cache_lock:
+                if generation == self._generation:
+                    self._cache[key] = cached
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+
+        # Views receive the kwargs, so never hand out the cached dict.
+        match, allowed = cached
+        if match is not None:
+            return [match[0], dict(match[1])], list(allowed)
+        return None, list(allowed)
+
+    def _lookup(self, method, request_uri):
         if "?" in request_uri:
             uri, args = request_uri.split('?')
-            uri = uri.strip('/').split('/')
+            uri = uri.strip('/')
         else:
-            uri = request_uri.split('/')
-
-        for r in self.routes:
-            r_method, r_uri, r_obj, r_name = r
-            r_uri = r_uri.split('/')
-            if method == r_method:
-                if len(uri) == len(r_uri):
-                    kwargs = {}
-                    for (i, v) in enumerate(r_uri):
-                        if len(v) > 0 and v[0] == '{':
-                            v = v.replace('{', '').replace('}', '')
-                            kwargs[v] = uri[i]
-                        elif v != uri[i]:
-                            break
-                        if i+1 == len(r_uri):
-                            return [r, kwargs]
-        return None
+            uri = request_uri
 
-    def route(self, req):
+        if self.matcher == 'regex':
+            if self._compiled is None:
+                self.compile()
+            found = self._search(method, uri)
+            if found is not None:
+                values, methods = found
+                r, names = methods[method]
+                return [r, dict(zip(names, values))], []
+            # Several route shapes may match, so every other method is
+            # tried as the tree does.
+            allowed = []
+            for m in self._compiled:
+                if m != method and self._search(m, uri) is not None:
+                    allowed.append(m)
+            return None, sorted(allowed)
+
+        uri = uri.split('/')
+        if method in self._tree:
+            values = []
+            found = self._tree[method].lookup(uri, 0, values)
+            if found is not None:
+                r, names = found
+                return [r, dict(zip(names, values))], []
+
+        allowed = []
+        for m in self._tree:
+            if m != method and self._tree[m].lookup(uri, 0, []) is not None:
+                allowed.append(m)
+        return None, sorted(allowed)
+
+    def _match(self, method, request_uri):
+        return self._resolve(method, request_uri)[0]
+
+    def resolve(self, req):
         uri = req.environ['PATH_INFO'].strip('/')
         if uri is None:
             uri = ''
         method = req.method
-        return self._match(method, uri)
+        return self._resolve(method, uri)
+
+    def route(self, req):
+        return self.resolve(req)[0]
 
     def add(self, method, route, obj, name=None):
         if re.search('\s', route):
             raise ValueError('Route may not include whitespace.')
         fields = re.findall('{([^}]*)}', route)
         for field in fields:
+            if ':' in field:
+                field, kind = field.split(':', 1)
+                if kind not in _converters:
+                    raise ValueError("Unknown field type '%s'." % (kind,))
             is_identifier = re.match('[A-Za-z_][A-Za-z0-9_]+$', field)
             if not is_identifier or field in keyword.kwlist:
                 raise ValueError('Field names must be valid identifiers.')
 
         route = route.strip('/')
-        if self._match(method, route) is None:
+        segments = _parse(route)
+
+        if method not in self._tree:
+            self._tree[method] = _Node()
+        node = self._tree[method]
+        for segment in segments:
+            node = node.child(segment)
+
+        if node.route is None:
             r = []
             r.append(method)
             r.append(route)
             r.append(obj)
             r.append(name)
+            names = [s[0] for s in segments if isinstance(s, tuple)]
+            node.route = (r, names)
             self.routes.append(r)
+
+            shape = tuple((None, s[1]) if isinstance(s, tuple) else s
+                          for s in segments)
+            if shape not in self._paths:
+                self._paths[shape] = {}
+            self._paths[shape][method] = node.route
+            self._compiled = None
+            self.cache_clear()
         else:
             raise nfw.Error('Adding duplicate API route %s' % (route))
@@ -36,18 +36,34 @@ from __future__ import unicode_literals
 
 import sys
 import os
+import re
 import logging
-import pickle
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 import time
 import datetime
 import fcntl
+import hashlib
+import hmac
+import base64
+import zlib
+import json
+import io
+import tempfile
 if sys.version[0] == '2':
-    import thread
     from Cookie import SimpleCookie
 else:
-    import _thread as thread
     from http.cookies import SimpleCookie
 import threading
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 import nfw
 
@@ -55,15 +71,19 @@ log = logging.getLogger(__name__)
 
 lock = threading.Lock()
 
+# Lock stripes for SessionShardedFile, selected by session id.
+_stripes = [threading.Lock() for _ in range(64)]
+
+_valid_id = re.compile('^[A-Za-z0-9]+$')
+
 
 class SessionBase(object):
     def __init__(self, config, **kwargs):
-        self._thread_id = thread.get_ident() 
         self.headers = nfw.Headers()
         app_config = config.get('application')
         self.use_x_forwarded_host = app_config.get('use_x_forwarded_host', False)
         self._name = None
-        self._expire = app_config.get('session_expire', 3600)
+        self._expire = int(app_config.get('session_expire', 3600))
         self._id = None
         if 'app_root' in kwargs:
             self._path = "%s/tmp/" % (kwargs['app_root'],)
@@ -82,85 +102,176 @@ class SessionBase(object):
         else:                                                                       
             return None
 
-    def setup(self, environ):
-        for p in environ:                                                           
-            if len(p) > 5 and 'HTTP_' in p:
-                hk = p.replace('HTTP_', '')
-                self.headers[hk] = environ[p]
-
+    def _cookie(self, environ):
+        view = nfw.EnvironView.get(environ)
+        self.headers = view.headers
         self.environ = environ
+        return view.cookies
 
-        cookie = SimpleCookie()
+    def _output(self, cookie, name, value):
+        cookie[name] = value
+        host = self._get_host(self.environ)
+        if host is not None:
+            cookie[name]['domain'] = host
+        cookie[name]['max-age'] = self._expire
+        return cookie[name].OutputString()
+
+    def setup(self, environ):
+        cookie = self._cookie(environ)
         name = nfw.utils.if_unicode_to_utf8('neutrino')
 
-        if 'HTTP_COOKIE' in self.environ:
-            cookie.load(self.environ['HTTP_COOKIE'])
-        if name in cookie:
+        if name in cookie and _valid_id.match(cookie[name].value):
             id = nfw.utils.if_unicode_to_utf8(cookie[name].value)
         else:
             id = nfw.utils.if_unicode_to_utf8(nfw.random_id(16))
 
         self._id = nfw.utils.if_unicode_to_utf8(id)
         self._name = "session:%s" % (id,)
-        cookie[name] = nfw.utils.if_unicode_to_utf8(id)
-        host = self._get_host(environ)
-        if host is not None:
-            cookie[name]['domain'] = host
-        cookie[name]['max-age'] = self._expire
-
-        cookie_string = cookie[name].OutputString()
+        cookie_string = self._output(SimpleCookie(), name, self._id)
         if hasattr(self, '_load'):
             self._load()
         return cookie_string
 
     def save(self):
         if hasattr(self, '_save'):
-            self._save()
+            return self._save()
+
+
+class _SessionDict(SessionBase):
+    def __setitem__(self, key, value):
+        self._session[key] = value
+
+    def __getitem__(self, key):
+        return self._session[key]
+
+    def __delitem__(self, key):
+        try:
+            del self._session[key]
+        except KeyError:
+            pass
+
+    def __contains__(self, key):
+        return key in self._session
+
+    def __iter__(self):
+        return iter(self._session)
+
+    def __len__(self):
+        return len(self._session)
+
+    def get(self, k, d=None):
+        return self._session.get(k, d)
+
+
+def _encode(value):
+    # Values as Redis returns them, so pipelined sessions read back the
+    # same values within a request as in the next one.
+    if isinstance(value, float):
+        value = repr(value)
+    elif not isinstance(value, (bytes, type(''))):
+        value = str(value)
+    return nfw.utils.if_unicode_to_utf8(value)
+
+
+def _decode(value):
+    if value == 'True':
+        return True
+    elif value == 'False':
+        return False
+    else:
+        return value
 
 
 class SessionRedis(SessionBase):
+    def __init__(self, config, **kwargs):
+        super(SessionRedis, self).__init__(config, **kwargs)
+        # Pipelined sessions load the hash with a single HGETALL on first
+        # access and write all changes with one MULTI/EXEC on save.
+        redis_config = config.get('redis')
+        self._pipeline = redis_config.getboolean('session_pipeline')
+
+    def _load(self):
+        self._session = None
+        self._dirty = set()
+        self._deleted = set()
+
+    def _fetch(self):
+        if self._session is None:
+            self._session = self._redis.hgetall(self._name)
+        return self._session
+
     def _save(self):
-        self._redis.expire(self._name, self._expire)
+        if self._pipeline is True:
+            pipe = self._redis.pipeline(transaction=True)
+            for key in self._dirty:
+                pipe.hset(self._name, key, self._session[key])
+            if len(self._deleted) > 0:
+                pipe.hdel(self._name, *self._deleted)
+            pipe.expire(self._name, self._expire)
+            pipe.execute()
+            self._dirty = set()
+            self._deleted = set()
+        else:
+            self._redis.expire(self._name, self._expire)
 
     def __setitem__(self, key, value):
-        self._redis.hset(self._name, key, value)
-        self._redis.expire(self._name, self._expire)
+        value = _encode(value)
+        if self._pipeline is True:
+            self._fetch()[key] = value
+            self._dirty.add(key)
+            self._deleted.discard(key)
+        else:
+            self._redis.hset(self._name, key, value)
+            self._redis.expire(self._name, self._expire)
 
     def __getitem__(self, key):
-        val = self._redis.hget(self._name, key)
-        if val == 'True':
-            return True
-        elif val == 'False':
-            return False
+        if self._pipeline is True:
+            return _decode(self._fetch().get(key))
         else:
-            return val
+            return _decode(self._redis.hget(self._name, key))
 
     def __delitem__(self, key):
-        self._redis.hdel(self._name, key)
+        if self._pipeline is True:
+            self._fetch().pop(key, None)
+            self._dirty.discard(key)
+            self._deleted.add(key)
+        else:
+            self._redis.hdel(self._name, key)
 
     def __contains__(self, key):
-        return self._redis.hexists(self._name, key)
+        if self._pipeline is True:
+            return key in self._fetch()
+        else:
+            return self._redis.hexists(self._name, key)
 
     def __iter__(self):
-        return iter(self._redis.hgetall(self._name))
+        if self._pipeline is True:
+            return iter(list(self._fetch()))
+        else:
+            return iter(self._redis.hgetall(self._name))
 
     def __len__(self):
-        return hlen(self._redis.hlen(self._name))
+        if self._pipeline is True:
+            return len(self._fetch())
+        else:
+            return self._redis.hlen(self._name)
 
     def get(self, k, d=None):
-        if k in self:
-            val = self._redis.hget(self._name, k)
-            if val == 'True':
-                return True
-            elif val == 'False':
-                return False
+        if self._pipeline is True:
+            session = self._fetch()
+            if k in session:
+                return _decode(session[k])
             else:
-                return val
+                return d
         else:
-            return d
+            val = self._redis.hget(self._name, k)
+            if val is None:
+                return d
+            else:
+                return _decode(val)
 
 
-class SessionFile(SessionBase):
+class SessionFile(_SessionDict):
     def _load(self):
         lock.acquire()
         try:
@@ -196,26 +307,305 @@ class SessionFile(SessionBase):
             h.close()
             lock.release()
 
-    def __setitem__(self, key, value):
-        self._session[key] = value
 
-    def __getitem__(self, key):
-        return self._session[key]
+def _dumps(value):
+    # Without the memo the pickled bytes depend only on the value, cPickle
+    # otherwise memoizes objects by their reference count.
+    buf = io.BytesIO()
+    pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+    pickler.fast = 1
+    pickler.dump(value)
+    return buf.getvalue()
 
-    def __delitem__(self, key):
+
+class SessionShardedFile(SessionFile):
+    # Sessions are spread over tmp/sessions/xx/yy/ by a hash of the id.
+    # Files are replaced with an atomic rename, so reads need no locking,
+    # and a session that was not modified is not written again.
+    def _file(self):
+        digest = hashlib.md5(self._id).hexdigest()
+        path = os.path.join(self._path, 'sessions', digest[0:2], digest[2:4])
+        return path, os.path.join(path, "%s.session" % (self._id,))
+
+    def _lock(self):
+        return _stripes[hash(self._id) % len(_stripes)]
+
+    def _load(self):
+        self._session = {}
+        self._raw = None
+        self._mtime = None
+        path, session_file = self._file()
         try:
-            del self._session[key]
-        except KeyError:
+            mtime = os.stat(session_file).st_mtime
+            if time.time() - mtime > self._expire:
+                return
+            with open(session_file, 'rb') as h:
+                raw = h.read()
+            self._session = pickle.loads(raw)
+            self._raw = raw
+            self._mtime = mtime
+        except (OSError, IOError):
             pass
 
-    def __contains__(self, key):
-        return key in self._session
+    def _save(self):
+        path, session_file = self._file()
+        raw = _dumps(self._session)
+        if raw == self._raw:
+            # Unchanged, only keep the session from expiring.
+            if (self._mtime is not None and
+                    time.time() - self._mtime > self._expire // 10):
+                try:
+                    os.utime(session_file, None)
+                except OSError:
+                    pass
+            return
+        if self._raw is None and len(self._session) == 0:
+            return
+
+        with self._lock():
+            try:
+                os.makedirs(path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+            fd, tmp = tempfile.mkstemp(dir=path, prefix='.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as h:
+                    h.write(raw)
+                os.rename(tmp, session_file)
+            except Exception:
+                os.unlink(tmp)
+                raise
+        self._raw = raw
+        self._mtime = time.time()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def _b64decode(data):
+    data = nfw.utils.if_unicode_to_utf8(data)
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+class SessionCookie(_SessionDict):
+    # The session is kept in the cookie itself as
+    # <format>.<data>.<timestamp>.<signature> where format is 'j' for JSON
+    # and 'z' for zlib compressed JSON, and the signature is a HMAC-SHA256
+    # of the rest using [application] session_secret.
+    max_size = 4093
 
-    def __iter__(self):
-        return iter(self._session)
+    def __init__(self, config, **kwargs):
+        super(SessionCookie, self).__init__(config, **kwargs)
+        app_config = config.get('application')
+        secret = app_config.get('session_secret')
+        if secret is None or secret.strip() == '':
+            raise nfw.Error("Cookie sessions require" +
+                            " [application] session_secret")
+        self._secret = nfw.utils.if_unicode_to_utf8(secret)
+        self._compress = app_config.getboolean('session_compress', True)
+        self._cookie_name = nfw.utils.if_unicode_to_utf8('neutrino')
+
+    def _sign(self, value):
+        value = nfw.utils.if_unicode_to_utf8(value)
+        return hmac.new(self._secret, value, hashlib.sha256).hexdigest()
+
+    def _unpack(self, value):
+        try:
+            fmt, data, ts, signature = value.split('.')
+            expected = self._sign('%s.%s.%s' % (fmt, data, ts))
+            if not hmac.compare_digest(nfw.utils.if_unicode_to_utf8(signature),
+                                       nfw.utils.if_unicode_to_utf8(expected)):
+                log.warning("Invalid session cookie signature")
+                return None, None, None
+            ts = int(ts)
+            if time.time() - ts > self._expire:
+                return None, None, None
+            data = _b64decode(data)
+            if fmt == 'z':
+                data = zlib.decompress(data)
+            elif fmt != 'j':
+                return None, None, None
+            payload = data.decode('utf-8')
+            session = json.loads(payload)
+            if not isinstance(session, dict):
+                return None, None, None
+            return session, payload, ts
+        except (ValueError, TypeError, zlib.error):
+            return None, None, None
 
-    def __len__(self):
-        return len(self._session)
+    def setup(self, environ):
+        cookie = self._cookie(environ)
+        self._session = {}
+        self._payload = None
+        self._issued = None
+        name = self._cookie_name
+        if name in cookie:
+            session, payload, issued = self._unpack(cookie[name].value)
+            if session is not None:
+                self._session = session
+                self._payload = payload
+                self._issued = issued
+        # The cookie is only known once the request is done, see _save().
+        return None
 
-    def get(self, k, d=None):
-        return self._session.get(k, d)
+    def _save(self):
+        try:
+            payload = json.dumps(self._session, separators=(',', ':'),
+                                 sort_keys=True)
+        except (TypeError, ValueError) as e:
+            log.error("Session could not be encoded as JSON (%s)," % (e,) +
+                      " changes to the session were not saved")
+            return None
+        if payload == self._payload:
+            if (self._issued is None or
+                    time.time() - self._issued < self._expire // 2):
+                # Unchanged and recently issued, keep the client's cookie.
+                return None
+        elif self._payload is None and len(self._session) == 0:
+            return None
+
+        data = payload.encode('utf-8')
+        fmt = 'j'
+        if self._compress is True:
+            compressed = zlib.compress(data)
+            if len(compressed) < len(data):
+                data = compressed
+                fmt = 'z'
+        value = '%s.%s.%s' % (fmt, _b64encode(data).decode('ascii'),
+                              int(time.time()))
+        value = '%s.%s' % (value, self._sign(value))
+        cookie_string = self._output(SimpleCookie(), self._cookie_name,
+                                     nfw.utils.if_unicode_to_utf8(value))
+        if len(cookie_string) > self.max_size:
+            log.error("Session of %s bytes exceeds the cookie size limit,"
+                      % (len(cookie_string),) +
+                      " changes to the session were not saved")
+            return None
+        self._payload = payload
+        return cookie_string
+
+
+def _scan(path, suffixes=('.session',)):
+    # Yields (path, is_dir, mtime) of a directory, for files only those
+    # ending in suffixes. With scandir the file type comes from the
+    # directory entry and the stat result is cached.
+    try:
+        if scandir is not None:
+            entries = scandir(path)
+        else:
+            entries = os.listdir(path)
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if scandir is not None:
+                if entry.is_dir(follow_symlinks=False):
+                    found = (entry.path, True, None)
+                elif entry.name.endswith(suffixes):
+                    found = (entry.path, False, entry.stat().st_mtime)
+                else:
+                    continue
+            else:
+                fpath = os.path.join(path, entry)
+                if os.path.isdir(fpath) and not os.path.islink(fpath):
+                    found = (fpath, True, None)
+                elif entry.endswith(suffixes):
+                    found = (fpath, False, os.stat(fpath).st_mtime)
+                else:
+                    continue
+        except OSError:
+            # Removed or renamed by a concurrent save since the directory
+            # was listed, the rest of it is still scanned.
+            continue
+        yield found
+
+
+class SessionCollector(object):
+    # Removes expired SessionFile and SessionShardedFile sessions from the
+    # application tmp folder in batches, pausing between batches so that a
+    # sweep never hogs the disk. Only one process sweeps at a time.
+    def __init__(self, app_root, expire=3600, batch=500, pause=0.05,
+                 interval=600):
+        self._path = os.path.join(app_root, 'tmp')
+        self.expire = int(expire)
+        self.batch = int(batch)
+        self.pause = float(pause)
+        self.interval = float(interval)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _walk(self):
+        pending = [(self._path, 0)]
+        while len(pending) > 0:
+            path, depth = pending.pop()
+            if depth > 0:
+                # Left over by a SessionShardedFile save that failed.
+                suffixes = ('.session', '.tmp')
+            else:
+                suffixes = ('.session',)
+            for fpath, is_dir, mtime in _scan(path, suffixes):
+                if is_dir is True:
+                    if ((depth == 0 and os.path.basename(fpath) == 'sessions') or
+                            depth > 0):
+                        pending.append((fpath, depth + 1))
+                else:
+                    yield fpath, mtime
+
+    def sweep(self, wait=False):
+        try:
+            os.makedirs(self._path)
+        except OSError:
+            pass
+        h = open(os.path.join(self._path, '.session_gc'), 'w')
+        try:
+            try:
+                if wait is True:
+                    fcntl.flock(h, fcntl.LOCK_EX)
+                else:
+                    fcntl.flock(h, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                return None
+
+            removed = 0
+            checked = 0
+            for fpath, mtime in self._walk():
+                if self._stop.is_set():
+                    break
+                if time.time() - mtime > self.expire:
+                    try:
+                        os.remove(fpath)
+                        removed += 1
+                    except OSError:
+                        pass
+                checked += 1
+                if checked % self.batch == 0 and self.pause > 0:
+                    self._stop.wait(self.pause)
+            return removed
+        finally:
+            h.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                removed = self.sweep()
+                if removed:
+                    log.info("Removed expired sessions: %s" % (removed,))
+            except Exception as e:
+                log.error("Session collector failed: %s" % (e,))
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            name='SessionCollector')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -38,10 +38,6 @@ import os
 import sys
 import logging
 import traceback
-if sys.version[0] == '2':
-    import thread
-else:
-    import _thread as thread
 
 from pkg_resources import DefaultProvider, ResourceManager, \
                           get_provider
@@ -51,14 +47,11 @@ from jinja2.utils import open_if_exists, internalcode
 from jinja2._compat import string_types, iteritems
 from jinja2.loaders import BaseLoader
 from jinja2 import loaders
-import threading
 
 import nfw
 
 log = logging.getLogger(__name__)
 
-lock = threading.Lock()
-
 
 class GetTemplateWrapper(object):
     def __init__(self, template, request):
@@ -90,20 +83,16 @@ class Jinja(object):
         return t.render(**kwargs)
 
     def __getattr__(self, attr):
-        lock.acquire()
-        try:
-            if attr == 'request':
-                return self._request
-            elif attr == 'load_templates':
-                return self._loader.load_templates 
-            elif attr == 'globals':
-                return getattr(self._jinja, attr)
-            elif attr == 'list_templates':
-                return getattr(self._jinja, attr)
-            else:
-                raise Exception("Neutrino Jinja Environment has no attribute %s" % (attr,))
-        finally:
-            lock.release()
+        if attr == 'request':
+            return self._request
+        elif attr == 'load_templates':
+            return self._loader.load_templates 
+        elif attr == 'globals':
+            return getattr(self._jinja, attr)
+        elif attr == 'list_templates':
+            return getattr(self._jinja, attr)
+        else:
+            raise Exception("Neutrino Jinja Environment has no attribute %s" % (attr,))
 
 
 class JinjaLoader(BaseLoader):
@@ -36,3 +36,6 @@ from .general import timer
 from .general import ObjectName
 from .general import import_module
 from .threaddict import ThreadDict
+from .context import RequestContext
+from .context import request_context
+from . import fastjson
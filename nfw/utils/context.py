@@ -0,0 +1,68 @@
+# Neutrino Framework
+#
+# Copyright (c) 2016-2017, Christiaan Frans Rademan
+# All rights reserved.
+#
+# LICENSE: (BSD3-Clause)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENTSHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class RequestContext(threading.local):
+    # State belonging to the request handled by the current thread, such
+    # as borrowed database connections and log extras. Each thread only
+    # sees its own attributes, so no locking is required, and Wsgi clears
+    # it when a request is done so that recycled threads do not keep
+    # anything alive.
+    def get(self, name, factory=None):
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            if factory is None:
+                return None
+            value = self.__dict__[name] = factory()
+            return value
+
+    def set(self, name, value):
+        self.__dict__[name] = value
+
+    def pop(self, name, default=None):
+        return self.__dict__.pop(name, default)
+
+    def clear(self):
+        self.__dict__.clear()
+
+
+request_context = RequestContext()
@@ -0,0 +1,169 @@
+# Neutrino Framework
+#
+# Copyright (c) 2016-2017, Christiaan Frans Rademan
+# All rights reserved.
+#
+# LICENSE: (BSD3-Clause)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENTSHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# JSON encoding and decoding through the fastest library available, picked
+# at import time separately for each, following benchmarks/fastjson.py:
+#
+#   dumps of a model: orjson, then the standard library. ujson and
+#   simplejson are slower than the standard library, since encoding a
+#   model is dominated by calls to the default hook.
+#   loads: orjson, then simplejson with its C speedups on Python 2, then
+#   the standard library.
+#
+# A library is only used to encode if it supports a default hook and hands
+# datetime values to it, so serializers keep their own datetime format.
+# Output always uses compact separators whatever the library.
+
+import sys
+import json
+import logging
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+_separators = (',', ':')
+
+
+def _stdlib():
+    def dumps(obj, default=None):
+        return json.dumps(obj, default=default, separators=_separators)
+
+    return ('json', dumps, json.loads)
+
+
+def _orjson():
+    import orjson
+
+    option = orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(obj, default=None):
+        return orjson.dumps(obj, default=default,
+                            option=option).decode('utf-8')
+
+    return ('orjson', dumps, orjson.loads)
+
+
+def _ujson():
+    import ujson
+
+    def dumps(obj, default=None):
+        return ujson.dumps(obj, default=default, ensure_ascii=False,
+                           escape_forward_slashes=False)
+
+    return ('ujson', dumps, ujson.loads)
+
+
+def _simplejson():
+    import simplejson
+
+    if (sys.version_info[0] != 2 or
+            simplejson.scanner.c_make_scanner is None):
+        # Only parses faster than the standard library of Python 2, and
+        # only with its C speedups.
+        raise ImportError('simplejson is not faster here')
+
+    # Encode exactly what json.dumps() would, leaving everything else to
+    # the default hook.
+    encoder = {'separators': _separators,
+               'use_decimal': False,
+               'namedtuple_as_object': False,
+               'tuple_as_array': True,
+               'iterable_as_array': False,
+               'for_json': False}
+
+    def dumps(obj, default=None):
+        return simplejson.dumps(obj, default=default, **encoder)
+
+    return ('simplejson', dumps, simplejson.loads)
+
+
+def _usable(dumps):
+    try:
+        return dumps([datetime(2000, 1, 1)],
+                     default=lambda o: 'default') == '["default"]'
+    except Exception:
+        return False
+
+
+def _select(candidates, encode):
+    for candidate in candidates:
+        try:
+            selected = candidate()
+        except ImportError:
+            continue
+        if encode is False or _usable(selected[1]):
+            return selected
+    return _stdlib()
+
+
+# Every library supported, which the benchmark and tests compare against
+# the standard library, and those picked from for each direction.
+_candidates = (_orjson, _ujson, _simplejson)
+_encoders = (_orjson,)
+_decoders = (_orjson, _simplejson)
+
+encoder, _dumps, _ = _select(_encoders, True)
+decoder, _, _loads = _select(_decoders, False)
+
+
+def dumps(obj, default=None, **kwargs):
+    # Extra json.dumps() options such as indent or sort_keys are only
+    # honoured by the standard library, which is used for such calls.
+    # The separators stay compact unless given.
+    if kwargs:
+        kwargs.setdefault('separators', _separators)
+        return json.dumps(obj, default=default, **kwargs)
+    return _dumps(obj, default=default)
+
+
+def _list_hook(o, list_type):
+    # Apply list_type to every array, innermost first, in the same order
+    # json.JSONDecoder would construct them.
+    if isinstance(o, list):
+        return list_type([_list_hook(v, list_type) for v in o])
+    elif isinstance(o, dict):
+        for k in o:
+            o[k] = _list_hook(o[k], list_type)
+    return o
+
+
+def loads(s, list_type=None):
+    if isinstance(s, bytes):
+        s = s.decode('utf-8')
+    o = _loads(s)
+    if list_type is not None:
+        o = _list_hook(o, list_type)
+    return o
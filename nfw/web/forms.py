@@ -114,9 +114,13 @@ class Base(nfw.ModelDict):
             else:
                 value = ""
 
+            # Declared fields are shared by every instance of the model,
+            # so a readonly form must not change them.
             f = self._declared_fields[key]
             if self.readonly is True:
-                f.readonly = self.readonly
+                readonly = True
+            else:
+                readonly = f.readonly
 
             if f.hidden is True:
                 pass
@@ -128,14 +132,14 @@ class Base(nfw.ModelDict):
                 dom.append(self.checkbox(key,
                                          value,
                                          label=f.label,
-                                         readonly=f.readonly,
+                                         readonly=readonly,
                                          prefix=f.prefix,
                                          suffix=f.suffix))
             elif isinstance(f, nfw.ModelDict.Password):
                 dom.append(self.input("%s" % (key,),
                                       value,
                                       label=f.label,
-                                      readonly=f.readonly,
+                                      readonly=readonly,
                                       required=f.required,
                                       size=f.length,
                                       max_length=f.max_length,
@@ -143,11 +147,11 @@ class Base(nfw.ModelDict):
                                       prefix=f.prefix,
                                       suffix=f.suffix,
                                       password=True))
-                if f.readonly is False:
+                if readonly is False:
                     dom.append(self.input("%s_confirm" % (key,),
                                           value,
                                           label="Confirm",
-                                          readonly=f.readonly,
+                                          readonly=readonly,
                                           required=f.required,
                                           size=f.length,
                                           max_length=f.max_length,
@@ -168,14 +172,14 @@ class Base(nfw.ModelDict):
                                            value,
                                            label=f.label,
                                            options=choices,
-                                           readonly=f.readonly,
+                                           readonly=readonly,
                                            prefix=f.prefix,
                                            suffix=f.suffix))
                 elif f.rows > 1:
                     dom.append(self.textarea(key,
                                              value,
                                              label=f.label,
-                                             readonly=f.readonly,
+                                             readonly=readonly,
                                              required=f.required,
                                              cols=f.cols,
                                              rows=f.rows,
@@ -186,7 +190,7 @@ class Base(nfw.ModelDict):
                     dom.append(self.input(key,
                                           value,
                                           label=f.label,
-                                          readonly=f.readonly,
+                                          readonly=readonly,
                                           required=f.required,
                                           size=f.length,
                                           max_length=f.max_length,
@@ -198,7 +202,7 @@ class Base(nfw.ModelDict):
                     dom.append(self.input(key,
                                           value,
                                           label=f.label,
-                                          readonly=f.readonly,
+                                          readonly=readonly,
                                           required=f.required,
                                           size=f.length,
                                           max_length=f.max_length,
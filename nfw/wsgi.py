@@ -45,7 +45,6 @@ if sys.version[0] == '2':
     import thread
 else:
     import _thread as thread
-import json
 import traceback
 import keyword
 import re
@@ -58,6 +57,32 @@ import nfw
 log = logging.getLogger(__name__)
 
 
+class _Stream(object):
+    # Body returned by a view as a generator or other iterator. It is
+    # handed to the server as is, and the request is only cleaned up once
+    # the server closes it, since the generator may still be reading from
+    # a database connection that cleanup would return to the pool.
+    def __init__(self, iterable, cleanup):
+        self._iterable = iterable
+        self._cleanup = cleanup
+
+    def __iter__(self):
+        try:
+            for chunk in self._iterable:
+                yield nfw.utils.if_unicode_to_utf8(chunk)
+        except Exception as e:
+            trace = str(traceback.format_exc())
+            log.error("%s\n%s" % (e, trace))
+            raise
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, 'close'):
+                self._iterable.close()
+        finally:
+            self._cleanup()
+
+
 class Wsgi(object):
     def __init__(self, app_root):
         nfw.app = self
@@ -78,19 +103,40 @@ class Wsgi(object):
             nfw.restart.track(config)
             nfw.restart.track(policy)
 
-        self.router = nfw.Router()
+        self.router = nfw.Router(self.app_config.get('router', 'tree'),
+                                 int(self.app_config.get('route_cache', 0)))
         self.views = []
         self.context = {}
         nfw.jinja = nfw.template.Jinja(self.config)
         modules = self.app_config.getitems('modules')
         self.modules = self._modules()
+        self.router.compile()
         nfw.jinja.load_templates()
         nfw.render_template = nfw.template.Jinja.render_template
+        self.session_backend = self.app_config.get('session_backend')
+        if self.session_backend is None:
+            if 'redis' in self.config:
+                self.session_backend = 'redis'
+            else:
+                self.session_backend = 'file'
+        if self.session_backend not in ('redis', 'file', 'sharded', 'cookie'):
+            raise nfw.Error("Unknown session backend: %s"
+                            % (self.session_backend,))
+        self.session_gc = None
+        if (self.session_backend in ('file', 'sharded') and
+                self.app_config.getboolean('session_gc')):
+            self.session_gc = nfw.SessionCollector(
+                self.app_root,
+                expire=self.app_config.get('session_expire', 3600),
+                batch=self.app_config.get('session_gc_batch', 500),
+                pause=self.app_config.get('session_gc_pause', 0.05),
+                interval=self.app_config.get('session_gc_interval', 600))
+            self.session_gc.start()
         middleware = self.app_config.getitems('middleware')
         self.middleware = self._m_objs(self.modules, middleware)
         if os.path.isfile(policy):
             policy = file(policy, 'r').read()
-            self.policy = json.loads(policy)
+            self.policy = nfw.utils.fastjson.loads(policy)
         else:
             self.policy = None
 
@@ -164,7 +210,7 @@ class Wsgi(object):
                 resp.body = dom.get()
         elif resp.headers.get('Content-Type') == nfw.APPLICATION_JSON:
             j = {'error': {'title': title, 'description': description}}
-            resp.body = json.dumps(j)
+            resp.body = nfw.utils.fastjson.dumps(j)
         else:
             if title is not None:
                 resp.write("%s\n" % (title,))
@@ -173,9 +219,23 @@ class Wsgi(object):
 
         return resp
 
+    def _session(self):
+        if self.session_backend == 'redis':
+            redis = nfw.redis(self.config)
+            return nfw.SessionRedis(self.config, redis=redis)
+        elif self.session_backend == 'sharded':
+            return nfw.SessionShardedFile(self.config, app_root=self.app_root)
+        elif self.session_backend == 'cookie':
+            return nfw.SessionCookie(self.config)
+        else:
+            return nfw.SessionFile(self.config, app_root=self.app_root)
+
     def _cleanup(self):
         nfw.RestClient().close_all()
         nfw.Mysql.close_all()
+        # Nothing borrowed by this request may leak into the next one
+        # served by the same thread.
+        nfw.utils.request_context.clear()
         self.logger.stdout.flush()
         sys.stdout.flush()
         sys.stderr.flush()
@@ -193,30 +253,21 @@ class Wsgi(object):
         # in the file like wsgi.input environment variable.
         debug = self.log_config.getboolean('debug')
 
-        if 'redis' in self.config:
-            redis = nfw.redis(self.config)
-            session = nfw.SessionRedis(self.config, redis=redis)
-        else:
-            session = nfw.SessionFile(self.config, app_root=self.app_root)
+        session = self._session()
         session_cookie = session.setup(environ)
 
-        mysql_config = self.config.get('mysql')
-        if mysql_config.get('database') is not None:
-            nfw.Mysql(**mysql_config.data)
-
         req = nfw.Request(environ, self.config, session, self.router, self.logger, self)
         resp = nfw.Response(req)
 
-        resp.headers['Set-Cookie'] = session_cookie
+        if session_cookie is not None:
+            resp.headers.add('Set-Cookie', session_cookie)
 
-        r = self.router.route(req)
+        r, allowed = self.router.resolve(req)
 
         if debug is True:
             log.debug("Request URI: %s" % (req.get_full_path()))
             log.debug("Request QUERY: %s" % (req.environ['QUERY_STRING'],))
 
-        response_headers = []
-
         nfw.jinja.globals['SITE'] = req.environ['SCRIPT_NAME']
         nfw.jinja.request['REQUEST'] = req
         if nfw.jinja.globals['SITE'] == '/':
@@ -229,6 +280,16 @@ class Wsgi(object):
 
         returned = None
         try:
+            # Borrowed here so that an exhausted pool is answered with an
+            # error page, and the request is still cleaned up.
+            mysql_config = self.config.get('mysql')
+            if mysql_config.get('database') is not None:
+                try:
+                    nfw.Mysql(**mysql_config.data)
+                except nfw.PoolTimeout as e:
+                    raise nfw.HTTPServiceUnavailable('Service Unavailable',
+                                                     str(e))
+
             if r is not None:
                 route, obj_kwargs = r
                 method, route, obj, name = route
@@ -254,6 +315,9 @@ class Wsgi(object):
                 else:
                     raise nfw.HTTPForbidden('Access Forbidden',
                                             'Access denied by application policy')
+            elif len(allowed) > 0:
+                raise nfw.HTTPMethodNotAllowed(allowed,
+                                               description=req.environ['PATH_INFO'])
             else:
                 raise nfw.HTTPNotFound(description=req.environ['PATH_INFO'])
 
@@ -271,39 +335,42 @@ class Wsgi(object):
             log.error("%s\n%s" % (e, trace))
             self._error(e, req, resp)
 
-        resp.headers['X-Powered-By'] = 'Neutrino'
-        resp.headers['X-Request-ID'] = req.request_id
-        # HTTP headers expected by the client
-        # They must be wrapped as a list of tupled pairs:
-        # [(Header name, Header value)].
-        for header in resp.headers:
-            header = nfw.utils.if_unicode_to_utf8(header)
-            value = nfw.utils.if_unicode_to_utf8(resp.headers[header])
-            h = (header, value)
-            response_headers.append(h)
-
         content_length = None
-
-        if returned is None:
+        if returned is None or returned is resp:
+            body = resp
+            streamed = resp.streaming
             content_length = resp.content_length
+            if resp.file_wrapper is not None:
+                # Only the file is read from here on, so the request can
+                # be cleaned up before the server sends it.
+                body = resp.file_wrapper
+                streamed = False
         else:
+            body = returned
+            streamed = not isinstance(returned, (str, bytes, list, tuple,
+                                                 nfw.Response))
             if isinstance(returned, str):
                 content_length = len(returned)
+        if streamed is True:
+            body = _Stream(body, self._cleanup)
+        else:
+            self._cleanup()
+        session_cookie = session.save()
+        if session_cookie is not None:
+            resp.headers.add('Set-Cookie', session_cookie)
 
-        if content_length is not None:
-            response_headers.append(('Content-Length'.encode('utf-8'),
-                                     str(content_length).encode('utf-8')))
+        resp.headers['X-Powered-By'] = 'Neutrino'
+        resp.headers['X-Request-ID'] = req.request_id
 
-        # Send status and headers to the server using the supplied function
-        start_response(resp.status, response_headers)
+        if content_length is not None:
+            resp.headers['Content-Length'] = content_length
 
-        self._cleanup()
-        session.save()
+        # Send status and headers to the server using the supplied function.
+        # HTTP headers expected by the client are kept by the response as
+        # the list of tupled pairs: [(Header name, Header value)].
+        start_response(resp.status, resp.headers.items())
 
-        if returned is not None:
-            return returned
-        else:
-            return resp
+        return body
 
     def _modules(self):
         app_config = self.config.get('application')
@@ -0,0 +1,85 @@
+# Neutrino Framework
+#
+# Copyright (c) 2016-2017, Christiaan Frans Rademan
+# All rights reserved.
+#
+# LICENSE: (BSD3-Clause)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENTSHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import logging
+import unittest
+from collections import OrderedDict
+from datetime import datetime
+
+import nfw
+from nfw.utils import fastjson
+
+log = logging.getLogger(__name__)
+
+
+class FastJson(unittest.TestCase):
+    def __init__(self, methodName):
+        super(FastJson, self).__init__(methodName)
+
+    def backends(self):
+        found = []
+        for candidate in fastjson._candidates + (fastjson._stdlib,):
+            try:
+                selected = candidate()
+            except ImportError:
+                continue
+            if fastjson._usable(selected[1]):
+                found.append(selected)
+        return found
+
+    def test_dumps(self):
+        obj = OrderedDict([('name', 'John'),
+                           ('created', datetime(2017, 1, 2, 3, 4, 5)),
+                           ('tags', [1, 2.5, None, True])])
+
+        def default(o):
+            return o.strftime("%Y/%m/%d %H:%M:%S")
+
+        expected = '{"name":"John","created":"2017/01/02 03:04:05","tags":[1,2.5,null,true]}'
+        for name, dumps, loads in self.backends():
+            self.assertEqual(dumps(obj, default=default), expected, name)
+            self.assertEqual(loads('{"a":[1,"b\\u00e1"]}'),
+                             {'a': [1, u'b\u00e1']}, name)
+        self.assertEqual(fastjson.dumps(obj, default=default), expected)
+        self.assertEqual(fastjson.dumps({'a': 1}, indent=1), '{\n "a":1\n}')
+        self.assertEqual(fastjson.dumps({'b': 1, 'a': [1, 2]}, sort_keys=True),
+                         '{"a":[1,2],"b":1}')
+
+    def test_list_type(self):
+        order = []
+
+        def list_type(values):
+            order.append(values)
+            return tuple(values)
+
+        result = fastjson.loads(b'{"a": [1, [2, 3]], "b": 4}', list_type=list_type)
+        self.assertEqual(result, {'a': (1, (2, 3)), 'b': 4})
+        self.assertEqual(order, [[2, 3], [1, (2, 3)]])
@@ -29,13 +29,24 @@
 # OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
 # ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
+import json
 import logging
 import unittest
+from datetime import datetime
 
 import nfw
 
 log = logging.getLogger(__name__)
 
+
+class Transaction(nfw.mysql.Testing):
+    commits = 0
+
+    def commit(self):
+        self.commits += 1
+        nfw.mysql.Testing.commit(self)
+
+
 class Model(unittest.TestCase):
     def __init__(self, methodName):
         super(Model, self).__init__(methodName)
@@ -55,22 +66,10 @@ class Model(unittest.TestCase):
         testrow['lastname'] = 'Doe'
         q['result'] = testtable
         queries.append(q)
-        # DICT MODEL: QUERY DATABASE FOR RECORDS
+        # DICT MODEL: UPDATE CHANGED FIELD ONLY
         q = {}
-        q['query'] = "SELECT firstname, lastname, id FROM Model WHERE id = %s"
-        q['values'] = [1,]
-        testtable = []
-        testrow = {}
-        testtable.append(testrow)
-        testrow['id'] = 1
-        testrow['firstname'] = 'John'
-        testrow['lastname'] = 'Doe'
-        q['result'] = testtable
-        queries.append(q)
-        # DICT MODEL: UPDATE DATABASE FOR RECORD
-        q = {}
-        q['query'] = "UPDATE Model SET firstname=%s,lastname=%s,id=%s WHERE id = %s"
-        q['values'] = ["John","Doe",1,1]
+        q['query'] = "UPDATE Model SET lastname=%s WHERE id = %s"
+        q['values'] = ["Smith",1]
         q['result'] = None
         queries.append(q)
 
@@ -94,9 +93,12 @@ class Model(unittest.TestCase):
         # DUMP DATA
         test = modeldict.dump_json()
 
-        # LOAD DATA
+        # LOAD DATA: UNCHANGED, NO QUERIES
         modeldict.load_json(test)
 
+        # UPDATE FIELD
+        modeldict['lastname'] = 'Smith'
+
         db.commit()
 
 
@@ -187,17 +189,6 @@ class Model(unittest.TestCase):
         q['last_row_id'] = 3
         queries.append(q)
 
-        q = {}
-        q['query'] = "SELECT firstname, lastname, submodel, id FROM Model WHERE id = %s"
-        q['values'] = [3,]
-        testtable = []
-        testrow = {}
-        testtable.append(testrow)
-        testrow['id'] = 3
-        testrow['submodel'] = 43
-        q['result'] = testtable
-        queries.append(q)
-
         q = {}
         q['query'] = "UPDATE Model SET firstname=%s,lastname=%s WHERE id = %s"
         q['values'] = ['Mark','Shuttleworth', 3]
@@ -226,19 +217,6 @@ class Model(unittest.TestCase):
         q['result'] = testtable
         queries.append(q)
 
-        q = {}
-        q['query'] = "SELECT firstname, lastname, submodel, id FROM Model WHERE id = %s"
-        q['values'] = [1,]
-        testtable = []
-        testrow = {}
-        testtable.append(testrow)
-        testrow['id'] = 1
-        testrow['firstname'] = 'Jane'
-        testrow['lastname'] = 'Doe'
-        testrow['submodel'] = 43
-        q['result'] = testtable
-        queries.append(q)
-
         q = {}
         q['query'] = "UPDATE Model SET submodel=%s WHERE id = %s"
         q['values'] = [43,1]
@@ -257,34 +235,12 @@ class Model(unittest.TestCase):
         queries.append(q)
 
         # LIST MODEL: UPDATE FIELD
-        q = {}
-        q['query'] = "SELECT firstname, lastname, submodel, id FROM Model WHERE id = %s"
-        q['values'] = [1,]
-        testtable = []
-        testrow = {}
-        testtable.append(testrow)
-        testrow['id'] = 1
-        testrow['lastname'] = 'Doe'
-        q['result'] = testtable
-        queries.append(q)
-
         q = {}
         q['query'] = "UPDATE Model SET firstname=%s WHERE id = %s"
         q['values'] = ['Bean',1]
         queries.append(q)
 
         # LIST MODEL: UPDATE SUB MODEL
-        q = {}
-        q['query'] = "SELECT age, id FROM SubModel WHERE id = %s"
-        q['values'] = [43,]
-        testtable = []
-        testrow = {}
-        testtable.append(testrow)
-        testrow['id'] = 43
-        testrow['age'] = 43
-        q['result'] = testtable
-        queries.append(q)
-
         q = {}
         q['query'] = "UPDATE SubModel SET age=%s WHERE id = %s"
         q['values'] = [83,43]
@@ -345,3 +301,237 @@ class Model(unittest.TestCase):
             if i == 1:
                 self.assertEqual(row['firstname'].value(), 'Mark')
                 self.assertEqual(row['submodel']['age'].value(), 83)
+        db.commit()
+
+    def test_upsert(self):
+        queries = []
+
+        # PRIMARY KEY KNOWN BUT NOT LOADED: SINGLE UPSERT
+        q = {}
+        q['query'] = ("INSERT INTO Model (firstname,id) VALUES (%s,%s)" +
+                      " ON DUPLICATE KEY UPDATE firstname=VALUES(firstname)")
+        q['values'] = ['John', 7]
+        queries.append(q)
+
+        # AFTERWARDS ONLY CHANGES ARE SENT
+        q = {}
+        q['query'] = "UPDATE Model SET lastname=%s WHERE id = %s"
+        q['values'] = ['Doe', 7]
+        queries.append(q)
+
+        db = nfw.mysql.Testing(queries)
+
+        class ModelDict(nfw.ModelDict):
+            class Meta:
+                db_table = 'Model'
+
+            firstname = nfw.Model.Text(required=True)
+            lastname = nfw.Model.Text(required=True)
+
+        modeldict = ModelDict(db=db)
+        modeldict({'id': 7, 'firstname': 'John'})
+        modeldict({'firstname': 'John', 'lastname': 'Doe'})
+        db.commit()
+
+    def test_statement_cache(self):
+        statements = nfw.model._get_statements('Cached', 'id')
+        self.assertIs(nfw.model._get_statements('Cached', 'id'), statements)
+        sql = statements.update(('firstname', 'lastname'))
+        self.assertEqual(sql, "UPDATE Cached SET firstname=%s,lastname=%s WHERE id = %s")
+        self.assertIs(statements.update(('firstname', 'lastname')), sql)
+        self.assertEqual(statements.insert(('firstname',)),
+                         "INSERT INTO Cached (firstname) VALUES (%s)")
+        self.assertEqual(statements.select(('firstname', 'id')),
+                         "SELECT firstname, id FROM Cached WHERE id = %s")
+
+    def test_bulk(self):
+        class Person(nfw.Model):
+            firstname = nfw.Model.Text(required=True)
+            lastname = nfw.Model.Text(required=True, max_length=20)
+
+        # BULK INSERT: TWO CHUNKS
+        queries = []
+        q = {}
+        q['query'] = "INSERT INTO Person (firstname,lastname) VALUES (%s,%s),(%s,%s)"
+        q['values'] = ['John', 'Doe', 'Jane', 'Doe']
+        queries.append(q)
+        q = {}
+        q['query'] = "INSERT INTO Person (firstname,lastname) VALUES (%s,%s)"
+        q['values'] = ['Mark', 'Shuttleworth']
+        queries.append(q)
+        db = Transaction(queries)
+        model = Person(db=db)
+        self.assertEqual(model.bulk_insert([{'firstname': 'John', 'lastname': 'Doe'},
+                                            {'firstname': 'Jane', 'lastname': 'Doe'},
+                                            {'firstname': 'Mark', 'lastname': 'Shuttleworth'}],
+                                           chunk_size=2), 3)
+        # The caller's transaction is left open.
+        self.assertEqual(db.commits, 0)
+        db.commit()
+
+        # BULK UPDATE
+        queries = []
+        q = {}
+        q['query'] = ("UPDATE Person SET firstname=CASE id WHEN %s THEN %s WHEN %s THEN %s" +
+                      " ELSE firstname END WHERE id IN (%s,%s)")
+        q['values'] = [1, 'Jack', 2, 'Jill', 1, 2]
+        queries.append(q)
+        db = nfw.mysql.Testing(queries)
+        model = Person(db=db)
+        model.bulk_update([{'id': 1, 'firstname': 'Jack'},
+                           {'id': 2, 'firstname': 'Jill'}])
+        db.commit()
+
+        # BULK UPSERT
+        queries = []
+        q = {}
+        q['query'] = ("INSERT INTO Person (firstname,lastname,id) VALUES (%s,%s,%s)" +
+                      " ON DUPLICATE KEY UPDATE firstname=VALUES(firstname),lastname=VALUES(lastname)")
+        q['values'] = ['John', 'Smith', 1]
+        queries.append(q)
+        db = nfw.mysql.Testing(queries)
+        model = Person(db=db)
+        model.bulk_upsert([{'id': 1, 'firstname': 'John', 'lastname': 'Smith'}])
+        db.commit()
+
+        # VALIDATION FAILS BEFORE ANY QUERY
+        model = Person(db=nfw.mysql.Testing([]))
+        self.assertRaises(nfw.FieldError, model.bulk_insert,
+                          [{'firstname': 'John', 'lastname': 'x' * 21}])
+        self.assertRaises(nfw.ValidationError, model.bulk_update,
+                          [{'firstname': 'John'}])
+
+    def test_iter_query(self):
+        queries = []
+
+        q = {}
+        q['query'] = "SELECT firstname, lastname FROM Model"
+        q['result'] = [{'id': 1, 'firstname': 'John', 'lastname': 'Doe', 'extra': 1},
+                       {'id': 2, 'firstname': 'Jane', 'lastname': 'Doe', 'extra': 2}]
+        queries.append(q)
+
+        db = nfw.mysql.Testing(queries)
+
+        class Model(nfw.Model):
+            firstname = nfw.Model.Text(required=True)
+            lastname = nfw.Model.Text(required=True)
+
+        model = Model(db=db)
+        rows = model.iter_query(batch_size=1)
+        self.assertEqual(next(rows), {'id': 1, 'firstname': 'John', 'lastname': 'Doe'})
+        self.assertEqual([row['firstname'] for row in rows], ['Jane'])
+        self.assertEqual(len(model), 0)
+        db.commit()
+
+    def test_readonly(self):
+        queries = []
+
+        q = {}
+        q['query'] = "SELECT firstname, created FROM Model"
+        q['result'] = [{'id': 1, 'firstname': 'John', 'created': datetime(2017, 1, 2, 3, 4, 5)},
+                       {'id': 2, 'firstname': 'Jane', 'created': datetime(2017, 2, 3, 4, 5, 6)}]
+        queries.append(q)
+
+        db = nfw.mysql.Testing(queries)
+
+        class Model(nfw.Model):
+            firstname = nfw.Model.Text(required=True)
+            created = nfw.Model.Datetime()
+
+        model = Model(db=db)
+        model.query(readonly=True)
+        self.assertIsInstance(model[0], nfw.model.Row)
+        self.assertIs(model[0]._index, model[1]._index)
+        self.assertEqual(model[1]['firstname'], 'Jane')
+        self.assertEqual(list(model[0]), ['firstname', 'created', 'id'])
+        self.assertRaises(nfw.ValidationError, model[0].__setitem__, 'firstname', 'Jack')
+        self.assertFalse(hasattr(model[0], '__dict__'))
+        self.assertEqual(json.loads(model.dump_json()),
+                         [{'firstname': 'John', 'created': '2017/01/02 03:04:05', 'id': 1},
+                          {'firstname': 'Jane', 'created': '2017/02/03 04:05:06', 'id': 2}])
+        db.commit()
+
+    def test_readonly_json(self):
+        queries = []
+
+        q = {}
+        q['query'] = "SELECT firstname, password, data, created FROM Model"
+        q['result'] = [{'id': 1, 'firstname': 'John', 'password': '$2b$12$hash',
+                        'data': '{"a": [1, 2]}', 'created': datetime(2017, 1, 2, 3, 4, 5)},
+                       {'id': 2, 'firstname': 'Jane', 'password': '$2b$12$hash',
+                        'data': '', 'created': None}]
+        queries.append(q)
+        queries.append(dict(q))
+
+        db = nfw.mysql.Testing(queries)
+
+        class Model(nfw.Model):
+            firstname = nfw.Model.Text(required=True)
+            password = nfw.Model.Password()
+            data = nfw.Model.JsonObject()
+            created = nfw.Model.Datetime()
+
+        model = Model(db=db)
+        model.query()
+        expected = model.dump_json()
+        self.assertEqual(json.loads(expected)[0]['data'], {'a': [1, 2]})
+        self.assertIsNone(json.loads(expected)[0]['password'])
+
+        model.query(readonly=True)
+        self.assertIsNone(model[0].value()['password'])
+        self.assertEqual(model.dump_json(), expected)
+        self.assertEqual(b''.join(model.stream_json()).decode('utf-8'),
+                         expected)
+        db.commit()
+
+    def test_declared_fields_cache(self):
+        class Model(nfw.Model):
+            firstname = nfw.Model.Text(required=True)
+            lastname = nfw.Model.Text(required=True)
+
+        first = Model()
+        second = Model()
+        self.assertIs(first._declared_fields, second._declared_fields)
+        self.assertEqual(list(first._declared_fields), ['firstname', 'lastname'])
+
+        with_db = Model(db=nfw.mysql.Testing([]))
+        self.assertEqual(list(with_db._declared_fields), ['firstname', 'lastname', 'id'])
+        self.assertEqual(list(first._declared_fields), ['firstname', 'lastname'])
+        self.assertIs(Model(db=nfw.mysql.Testing([]))._declared_fields,
+                      with_db._declared_fields)
+
+    def test_readonly_form(self):
+        class Form(nfw.web.Form):
+            name = nfw.ModelDict.Text()
+
+        self.assertIn('readonly', str(Form({}, readonly=True)))
+        self.assertFalse(Form({})._declared_fields['name'].readonly)
+        self.assertNotIn('readonly', str(Form({})))
+
+    def test_stream_json(self):
+        queries = []
+
+        q = {}
+        q['query'] = "SELECT firstname, created FROM Model"
+        q['result'] = [{'id': 1, 'firstname': 'John', 'created': datetime(2017, 1, 2, 3, 4, 5)},
+                       {'id': 2, 'firstname': u'J\u00e1ne', 'created': None}]
+        queries.append(q)
+        q = dict(queries[0])
+        queries.append(q)
+
+        db = nfw.mysql.Testing(queries)
+
+        class Model(nfw.Model):
+            firstname = nfw.Model.Text(required=True)
+            created = nfw.Model.Datetime()
+
+        model = Model(db=db)
+        model.query()
+        chunks = list(model.stream_json(chunk_size=16))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(b''.join(chunks).decode('utf-8'), model.dump_json())
+
+        model.query(readonly=True)
+        self.assertEqual(b''.join(model.stream_json()).decode('utf-8'),
+                         model.dump_json())
+        db.commit()
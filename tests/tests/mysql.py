@@ -0,0 +1,179 @@
+# Neutrino Framework
+#
+# Copyright (c) 2016-2017, Christiaan Frans Rademan
+# All rights reserved.
+#
+# LICENSE: (BSD3-Clause)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENTSHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import time
+import logging
+import threading
+import unittest
+
+import nfw
+
+log = logging.getLogger(__name__)
+
+
+class Connection(object):
+    def __init__(self):
+        self.pings = 0
+        self.closed = False
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+
+    def close(self):
+        self.closed = True
+
+    def cursor(self, cursorclass=None):
+        return None
+
+
+class Pool(unittest.TestCase):
+    def __init__(self, methodName):
+        super(Pool, self).__init__(methodName)
+
+    def test_reuse(self):
+        pool = nfw.mysql.Pool(Connection, max_size=2, ping=60)
+        conn = pool.get()
+        pool.put(conn)
+        self.assertIs(pool.get(), conn)
+        self.assertEqual(conn.pings, 0)
+        pool.put(conn)
+        stats = pool.stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['idle'], 1)
+
+    def test_timeout(self):
+        pool = nfw.mysql.Pool(Connection, max_size=1, timeout=0.05)
+        conn = pool.get()
+        self.assertRaises(nfw.PoolTimeout, pool.get)
+        stats = pool.stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertEqual(stats['timeouts'], 1)
+        pool.discard(conn)
+        self.assertTrue(conn.closed)
+        self.assertIsNot(pool.get(), conn)
+
+    def test_idle(self):
+        pool = nfw.mysql.Pool(Connection, min_size=1, idle=0, ping=0)
+        conns = [pool.get(), pool.get()]
+        for conn in conns:
+            pool.put(conn)
+        time.sleep(0.01)
+        conn = pool.get()
+        self.assertIs(conn, conns[1])
+        self.assertEqual(conn.pings, 1)
+        self.assertTrue(conns[0].closed)
+        self.assertEqual(pool.stats()['closed'], 1)
+
+
+class Context(unittest.TestCase):
+    def __init__(self, methodName):
+        super(Context, self).__init__(methodName)
+
+    def test_thread_isolation(self):
+        pool = nfw.Mysql._pool['context'] = nfw.mysql.Pool(Connection)
+        try:
+            db = nfw.Mysql(name='context')
+            mine = db._thread['context']['db']
+            other = {}
+
+            def worker():
+                other['db'] = nfw.Mysql(name='context')._thread['context']['db']
+                nfw.Mysql.close_all()
+                other['after'] = 'mysql' in nfw.utils.request_context.__dict__
+
+            t = threading.Thread(target=worker)
+            t.start()
+            t.join()
+            self.assertIsNot(other['db'], mine)
+            self.assertFalse(other['after'])
+            self.assertIs(db._thread['context']['db'], mine)
+            self.assertEqual(pool.stats()['in_use'], 1)
+            nfw.Mysql.close_all()
+            self.assertEqual(pool.stats()['in_use'], 0)
+            self.assertEqual(pool.stats()['idle'], 2)
+        finally:
+            nfw.utils.request_context.clear()
+            del nfw.Mysql._pool['context']
+
+    def test_threaddict(self):
+        d = nfw.ThreadDict()
+        d['REQUEST'] = 'main'
+        seen = {}
+
+        def worker():
+            seen['before'] = 'REQUEST' in d
+            d['REQUEST'] = 'worker'
+
+        t = threading.Thread(target=worker)
+        t.start()
+        t.join()
+        self.assertFalse(seen['before'])
+        self.assertEqual(d['REQUEST'], 'main')
+        nfw.utils.request_context.clear()
+        self.assertFalse('REQUEST' in d)
+
+
+class Cursor(object):
+    def __init__(self, rows):
+        self.rows = rows
+        self.fetches = []
+        self.closed = False
+
+    def execute(self, query, params=None):
+        self.query = query
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        self.fetches.append(len(rows))
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+class Iterate(unittest.TestCase):
+    def __init__(self, methodName):
+        super(Iterate, self).__init__(methodName)
+
+    def test_batches(self):
+        cursor = Cursor([{'id': i} for i in range(5)])
+        rows = nfw.mysql.iterate(cursor, "SELECT id FROM t", None, 2)
+        self.assertEqual([row['id'] for row in rows], [0, 1, 2, 3, 4])
+        self.assertEqual(cursor.fetches, [2, 2, 1, 0])
+        self.assertTrue(cursor.closed)
+
+    def test_close_early(self):
+        cursor = Cursor([{'id': i} for i in range(5)])
+        rows = nfw.mysql.iterate(cursor, "SELECT id FROM t", None, 2)
+        next(rows)
+        rows.close()
+        self.assertTrue(cursor.closed)
@@ -0,0 +1,247 @@
+# Neutrino Framework
+#
+# Copyright (c) 2016-2017, Christiaan Frans Rademan
+# All rights reserved.
+#
+# LICENSE: (BSD3-Clause)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENTSHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import io
+import gzip
+import logging
+import unittest
+
+import nfw
+from nfw.request import Post
+from nfw.request import _json
+
+log = logging.getLogger(__name__)
+
+BOUNDARY = b'----nfwboundary'
+
+
+def multipart(*parts):
+    body = []
+    for headers, content in parts:
+        body.append(b'--' + BOUNDARY + b'\r\n')
+        for header in headers:
+            body.append(header + b'\r\n')
+        body.append(b'\r\n')
+        body.append(content + b'\r\n')
+    body.append(b'--' + BOUNDARY + b'--\r\n')
+    return b''.join(body)
+
+
+def environ(body, content_type=None):
+    if content_type is None:
+        content_type = 'multipart/form-data; boundary=%s' % (BOUNDARY.decode('utf-8'),)
+    return {'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body))}
+
+
+class Form(unittest.TestCase):
+    def __init__(self, methodName):
+        super(Form, self).__init__(methodName)
+
+    def body(self):
+        return multipart(
+            ([b'Content-Disposition: form-data; name="name"'], b'John'),
+            ([b'Content-Disposition: form-data; name="tag"'], b'a'),
+            ([b'Content-Disposition: form-data; name="tag"'], b'b'),
+            ([b'Content-Disposition: form-data; name="upload"; filename="data.bin"',
+              b'Content-Type: application/octet-stream'],
+             b'\r\n--' + BOUNDARY[:-1] + b'x' * 3000))
+
+    def test_multipart(self):
+        body = self.body()
+        for chunk_size in (7, 64, 65536):
+            post = Post(io.BytesIO(body), environ(body), spool_size=1024,
+                        chunk_size=chunk_size)
+            self.assertEqual(list(post), ['name', 'tag', 'upload'])
+            self.assertEqual(post['name'].value, 'John')
+            self.assertEqual(post.get('tag'), 'a,b')
+            upload = post['upload']
+            self.assertEqual(upload.filename, 'data.bin')
+            self.assertEqual(upload.type, 'application/octet-stream')
+            self.assertEqual(b''.join(upload),
+                             b'\r\n--' + BOUNDARY[:-1] + b'x' * 3000)
+            # Spooled to disk once over the spool size.
+            self.assertTrue(upload.file._rolled)
+
+    def test_query(self):
+        body = b'a=1&b=2'
+        env = environ(body, 'application/x-www-form-urlencoded')
+        env['QUERY_STRING'] = 'q=9&a=3'
+        post = Post(io.BytesIO(body), env)
+        self.assertEqual(sorted(post), ['a', 'b', 'q'])
+        # Body fields are not replaced by the query string.
+        self.assertEqual(post['a'].value, '1')
+        self.assertEqual(post['q'].value, '9')
+
+        post = Post(io.BytesIO(b''), {'REQUEST_METHOD': 'GET',
+                                      'QUERY_STRING': 'q=9'})
+        self.assertEqual(list(post), ['q'])
+
+    def test_limits(self):
+        body = self.body()
+        self.assertRaises(nfw.HTTPPayloadTooLarge, Post, io.BytesIO(body),
+                          environ(body), max_body=len(body) - 1)
+        self.assertRaises(nfw.HTTPPayloadTooLarge, Post, io.BytesIO(body),
+                          environ(body), max_part=1000)
+        post = Post(io.BytesIO(body), environ(body), max_body=len(body),
+                    max_part=4000)
+        self.assertEqual(len(post), 3)
+
+        truncated = body[:-40]
+        self.assertRaises(nfw.HTTPBadRequest, Post, io.BytesIO(truncated),
+                          environ(truncated))
+
+    def test_urlencoded(self):
+        body = b'name=John+Doe&tag=a&tag=b&empty='
+        post = Post(io.BytesIO(body),
+                    environ(body, 'application/x-www-form-urlencoded'))
+        self.assertEqual(post['name'].value, 'John Doe')
+        self.assertEqual(post.get('tag'), 'a,b')
+        self.assertEqual(post['empty'].value, '')
+        self.assertEqual(post.get('missing', 'default'), 'default')
+
+    def test_urlencoded_gzip(self):
+        body = gzipped(b'name=J%C3%B6hn&tag=a')
+        env = environ(body, 'application/x-www-form-urlencoded')
+        env['HTTP_CONTENT_ENCODING'] = 'gzip'
+        post = Post(io.BytesIO(body), env)
+        self.assertEqual(post['name'].value, u'J\u00f6hn'.encode('utf-8'))
+        self.assertEqual(post['tag'].value, 'a')
+
+
+def gzipped(data):
+    buf = io.BytesIO()
+    f = gzip.GzipFile(fileobj=buf, mode='wb')
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+
+class Json(unittest.TestCase):
+    def __init__(self, methodName):
+        super(Json, self).__init__(methodName)
+
+    def test_json(self):
+        body = b'{"name": "John", "tags": [1, 2]}'
+        env = environ(body, 'application/json')
+        self.assertEqual(_json(io.BytesIO(body), env, 0),
+                         {'name': 'John', 'tags': [1, 2]})
+        self.assertIsNone(_json(io.BytesIO(b''), environ(b''), 0))
+        self.assertRaises(nfw.HTTPBadRequest, _json, io.BytesIO(b'{'),
+                          environ(b'{'), 0)
+
+    def test_gzip(self):
+        body = gzipped(b'[' + b'1,' * 5000 + b'1]')
+        env = environ(body, 'application/json')
+        env['HTTP_CONTENT_ENCODING'] = 'gzip'
+        self.assertEqual(len(_json(io.BytesIO(body), env, 0)), 5001)
+        # The limit applies to the decompressed body.
+        self.assertRaises(nfw.HTTPPayloadTooLarge, _json, io.BytesIO(body),
+                          env, 5000)
+        self.assertRaises(nfw.HTTPBadRequest, _json,
+                          io.BytesIO(b'not gzip'), env, 0)
+        # Inflated bodies are bounded by default without max_body.
+        bomb = gzipped(b'0' * 11000000)
+        env = environ(bomb, 'application/json')
+        env['HTTP_CONTENT_ENCODING'] = 'gzip'
+        self.assertRaises(nfw.HTTPPayloadTooLarge, _json, io.BytesIO(bomb),
+                          env, 0)
+        env = environ(bomb, 'application/x-www-form-urlencoded')
+        env['HTTP_CONTENT_ENCODING'] = 'gzip'
+        self.assertRaises(nfw.HTTPPayloadTooLarge, Post, io.BytesIO(bomb),
+                          env)
+        env['HTTP_CONTENT_ENCODING'] = 'br'
+        self.assertRaises(nfw.HTTPUnsupportedMediaType, _json,
+                          io.BytesIO(body), env, 0)
+
+
+class View(unittest.TestCase):
+    def __init__(self, methodName):
+        super(View, self).__init__(methodName)
+
+    def test_view(self):
+        env = {'QUERY_STRING': 'id=1&id=2&name=x',
+               'HTTP_HOST': 'example.com',
+               'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest',
+               'HTTP_COOKIE': 'neutrino=abc; theme=dark'}
+        view = nfw.EnvironView.get(env)
+        self.assertIs(nfw.EnvironView.get(env), view)
+        # Nothing is parsed until used.
+        self.assertIsNone(view._headers)
+        self.assertIsNone(view._query)
+        self.assertIsNone(view._cookies)
+        self.assertEqual(view.headers['Host'], b'example.com')
+        self.assertIn('X-Requested-With', view.headers)
+        self.assertNotIn('cookie_x', view.headers)
+        self.assertEqual(view.query['id'], ['1', '2'])
+        self.assertEqual(view.cookies['theme'].value, 'dark')
+        self.assertIs(view.headers, view.headers)
+        self.assertIs(view.cookies, view.cookies)
+
+    def test_session(self):
+        env = {'HTTP_HOST': 'example.com',
+               'HTTP_COOKIE': 'neutrino=abc'}
+        view = nfw.EnvironView.get(env)
+        session = nfw.SessionFile(nfw.Config(), app_root='/tmp')
+        cookie = session._cookie(env)
+        self.assertIs(cookie, view.cookies)
+        self.assertIs(session.headers, view.headers)
+        session._output(nfw.headers.SimpleCookie(), 'neutrino', 'def')
+        self.assertEqual(view.cookies['neutrino'].value, 'abc')
+
+
+class Slots(unittest.TestCase):
+    def __init__(self, methodName):
+        super(Slots, self).__init__(methodName)
+
+    def test_request(self):
+        class wsgi(object):
+            context = {}
+
+        env = {'REQUEST_METHOD': 'get',
+               'SCRIPT_NAME': '/test',
+               'REMOTE_ADDR': '127.0.0.1',
+               'QUERY_STRING': 'id=1',
+               'HTTP_HOST': 'example.com',
+               'wsgi.input': io.BytesIO()}
+        req = nfw.Request(env, {}, {}, None,
+                          nfw.Logger('test', None, None, False), wsgi())
+        self.assertFalse(hasattr(req, '__dict__'))
+        self.assertEqual(req.method, 'get')
+        req.method = 'post'
+        self.assertEqual(req.METHOD, 'POST')
+        self.assertEqual(req.Query['id'], ['1'])
+        self.assertEqual(req.headers['host'], b'example.com')
+        req.view = 'test'
+        self.assertEqual(req.view, 'test')
+        self.assertRaises(AttributeError, setattr, req, 'environ', {})
+        self.assertRaises(AttributeError, setattr, req, 'unknown', 1)
+        self.assertRaises(AttributeError, getattr, req, 'unknown')
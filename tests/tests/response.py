@@ -0,0 +1,179 @@
+# Neutrino Framework
+#
+# Copyright (c) 2016-2017, Christiaan Frans Rademan
+# All rights reserved.
+#
+# LICENSE: (BSD3-Clause)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENTSHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os
+import io
+import logging
+import tempfile
+import unittest
+
+import nfw
+
+log = logging.getLogger(__name__)
+
+
+class Request(object):
+    environ = None
+
+
+class Response(unittest.TestCase):
+    def __init__(self, methodName):
+        super(Response, self).__init__(methodName)
+
+    def test_chunks(self):
+        resp = nfw.Response()
+        resp.write('line one\n')
+        resp.write(u'line tw\u00f6\n')
+        self.assertEqual(resp.content_length, 19)
+        self.assertEqual(list(resp), [b'line one\n', b'line tw\xc3\xb6\n'])
+        self.assertFalse(resp.streaming)
+
+        resp.seek(0)
+        self.assertEqual(resp.readline(), b'line one\n')
+        self.assertEqual(resp.read(4), b'line')
+        self.assertEqual(resp.read(), b' tw\xc3\xb6\n')
+
+        resp.body = 'replaced'
+        self.assertEqual(list(resp), [b'replaced'])
+        self.assertEqual(resp.content_length, 8)
+
+    def test_stream(self):
+        def body():
+            yield 'first'
+            yield u'second'
+
+        resp = nfw.Response()
+        resp.write('discarded')
+        resp.stream(body())
+        self.assertTrue(resp.streaming)
+        self.assertIsNone(resp.content_length)
+        self.assertRaises(nfw.Error, resp.write, 'more')
+        self.assertEqual(list(resp), [b'first', b'second'])
+
+        resp.stream(['known'], content_length=5)
+        self.assertEqual(resp.content_length, 5)
+        resp.clear()
+        self.assertFalse(resp.streaming)
+        self.assertEqual(resp.content_length, 0)
+
+        # A stream that is replaced or cleared is closed.
+        first = io.BytesIO(b'first')
+        second = io.BytesIO(b'second')
+        resp.stream(first)
+        resp.stream(second)
+        self.assertTrue(first.closed)
+        self.assertFalse(second.closed)
+        resp.clear()
+        self.assertTrue(second.closed)
+
+    def test_slots(self):
+        resp = nfw.Response()
+        self.assertFalse(hasattr(resp, '__dict__'))
+        self.assertRaises(AttributeError, setattr, resp, 'headers', {})
+        self.assertRaises(AttributeError, setattr, resp, 'unknown', 1)
+        resp.status = nfw.HTTP_404
+        self.assertEqual(resp.status, nfw.HTTP_404)
+
+    def test_headers(self):
+        headers = nfw.ResponseHeaders({'Content-Type': 'text/plain'})
+        headers['content-type'] = nfw.TEXT_HTML
+        headers['Expires'] = 0
+        headers.add('Set-Cookie', 'a=1')
+        headers.add('set-cookie', u'b=\u00e1')
+        self.assertEqual(headers['CONTENT-TYPE'], nfw.TEXT_HTML)
+        self.assertEqual(headers.get('expires'), b'0')
+        self.assertIsNone(headers.get('Location'))
+        self.assertEqual(headers.getlist('Set-Cookie'),
+                         [b'a=1', b'b=\xc3\xa1'])
+        self.assertEqual(len(headers), 3)
+        self.assertEqual(headers.items(),
+                         [('content-type', nfw.TEXT_HTML),
+                          ('Expires', b'0'),
+                          ('Set-Cookie', b'a=1'),
+                          ('set-cookie', b'b=\xc3\xa1')])
+        headers['Set-Cookie'] = 'c=3'
+        del headers['expires']
+        self.assertNotIn('Expires', headers)
+        self.assertEqual(headers.items(),
+                         [('content-type', nfw.TEXT_HTML),
+                          ('Set-Cookie', b'c=3')])
+
+    def send_file(self, environ):
+        req = Request()
+        req.environ = environ
+        resp = nfw.Response(req)
+        resp.send_file(self.path, chunk_size=4)
+        return resp
+
+    def test_send_file(self):
+        fd, self.path = tempfile.mkstemp(suffix='.txt')
+        try:
+            os.write(fd, b'0123456789')
+            os.close(fd)
+
+            resp = self.send_file({})
+            self.assertEqual(resp.status, nfw.HTTP_200)
+            self.assertEqual(resp.content_length, 10)
+            self.assertEqual(resp.headers['Content-Type'], 'text/plain')
+            self.assertEqual(list(resp), [b'0123', b'4567', b'89'])
+            resp.close()
+            mtime = resp.headers['Last-Modified']
+
+            wrapped = []
+
+            def file_wrapper(f, size):
+                wrapped.append(size)
+                return iter(lambda: f.read(size), b'')
+
+            resp = self.send_file({'wsgi.file_wrapper': file_wrapper})
+            self.assertEqual(b''.join(resp), b'0123456789')
+            self.assertEqual(wrapped, [4])
+
+            resp = self.send_file({'HTTP_RANGE': 'bytes=2-6'})
+            self.assertEqual(resp.status, nfw.HTTP_206)
+            self.assertEqual(resp.headers['Content-Range'], 'bytes 2-6/10')
+            self.assertEqual(resp.content_length, 5)
+            self.assertEqual(b''.join(resp), b'23456')
+
+            resp = self.send_file({'HTTP_RANGE': 'bytes=-3'})
+            self.assertEqual(b''.join(resp), b'789')
+
+            resp = self.send_file({'HTTP_RANGE': 'bytes=10-'})
+            self.assertEqual(resp.status, nfw.HTTP_416)
+            self.assertEqual(resp.headers['Content-Range'], 'bytes */10')
+
+            resp = self.send_file({'HTTP_IF_MODIFIED_SINCE': mtime})
+            self.assertEqual(resp.status, nfw.HTTP_304)
+            self.assertEqual(list(resp), [])
+        finally:
+            os.unlink(self.path)
+
+        self.assertRaises(nfw.HTTPNotFound, self.send_file, {})
@@ -41,14 +41,17 @@ log = logging.getLogger(__name__)
 
 
 class Routes(unittest.TestCase):
+    matcher = 'tree'
+
     def __init__(self, methodName):
 
         class wsgi(object):
             context = {}
 
         app = wsgi()
+        self.app = app
 
-        self.router = nfw.Router()
+        self.router = nfw.Router(self.matcher)
         self.config = {}
         self.session = {}
         self.logger = nfw.Logger('test', None, None, False)
@@ -109,3 +112,87 @@ class Routes(unittest.TestCase):
         self.router.add(nfw.HTTP_PUT, '/kwargs/{var1}/{var2}', self.view, 'kwargs_test:kwargs_test')
         kwargs = {'var1': 'test1', 'var2': 'test2'}
         r = self.route(nfw.HTTP_PUT, '/kwargs/test1/test2', 'kwargs_test:kwargs_test', kwargs)
+
+    def test_static_before_placeholder(self):
+        self.router.add(nfw.HTTP_GET, '/items/{item}', self.view, 'item:get')
+        self.router.add(nfw.HTTP_GET, '/items/new', self.view, 'item:new')
+        self.route(nfw.HTTP_GET, '/items/new', 'item:new', {})
+        self.route(nfw.HTTP_GET, '/items/old', 'item:get', {'item': 'old'})
+
+    def test_backtrack(self):
+        self.router.add(nfw.HTTP_GET, '/a/b/c', self.view, 'abc:get')
+        self.router.add(nfw.HTTP_GET, '/a/{var1}/d', self.view, 'ad:get')
+        self.route(nfw.HTTP_GET, '/a/b/d', 'ad:get', {'var1': 'b'})
+
+    def test_typed(self):
+        self.router.add(nfw.HTTP_GET, '/user/{id:int}', self.view, 'user:id')
+        self.router.add(nfw.HTTP_GET, '/user/{name}', self.view, 'user:name')
+        self.route(nfw.HTTP_GET, '/user/42', 'user:id', {'id': 42})
+        self.route(nfw.HTTP_GET, '/user/john', 'user:name', {'name': 'john'})
+
+    def test_duplicate(self):
+        self.router.add(nfw.HTTP_GET, '/dup/{var1}', self.view, 'dup:get')
+        self.assertRaises(nfw.Error, self.router.add, nfw.HTTP_GET,
+                          '/dup/{var2}', self.view, 'dup:get')
+        self.assertRaises(ValueError, self.router.add, nfw.HTTP_GET,
+                          '/dup/{var1:bad}', self.view, 'dup:get')
+
+    def test_not_found(self):
+        self.router.add(nfw.HTTP_GET, '/found', self.view, 'found:get')
+        self.environ['PATH_INFO'] = '/missing'
+        self.assertEqual(self.router.route(self.req), None)
+        self.environ['PATH_INFO'] = '/found'
+        self.req.method = nfw.HTTP_POST
+        self.assertEqual(self.router.route(self.req), None)
+
+    def test_method_not_allowed(self):
+        self.router.add(nfw.HTTP_GET, '/allowed/{var1}', self.view, 'a:get')
+        self.router.add(nfw.HTTP_PUT, '/allowed/{var2}', self.view, 'a:put')
+        self.environ['PATH_INFO'] = '/allowed/test'
+        self.req.method = nfw.HTTP_DELETE
+        r, allowed = self.router.resolve(self.req)
+        self.assertEqual(r, None)
+        self.assertEqual(allowed, [nfw.HTTP_GET, nfw.HTTP_PUT])
+        self.environ['PATH_INFO'] = '/allowed'
+        r, allowed = self.router.resolve(self.req)
+        self.assertEqual(allowed, [])
+
+    def test_method_not_allowed_shapes(self):
+        self.router.add(nfw.HTTP_GET, '/shape/{id:int}', self.view, 's:get')
+        self.router.add(nfw.HTTP_PUT, '/shape/{name}', self.view, 's:put')
+        self.environ['PATH_INFO'] = '/shape/5'
+        self.req.method = nfw.HTTP_DELETE
+        r, allowed = self.router.resolve(self.req)
+        self.assertEqual(r, None)
+        self.assertEqual(allowed, [nfw.HTTP_GET, nfw.HTTP_PUT])
+
+    def test_cache(self):
+        self.router = nfw.Router(self.matcher, cache_size=2)
+        self.req = nfw.Request(self.environ, self.config, self.session,
+                               self.router, self.logger, self.app)
+        self.router.add(nfw.HTTP_GET, '/cache/{var1}', self.view, 'c:get')
+        self.route(nfw.HTTP_GET, '/cache/a', 'c:get', {'var1': 'a'})
+        self.route(nfw.HTTP_GET, '/cache/a', 'c:get', {'var1': 'a'})
+        self.environ['PATH_INFO'] = '/missing'
+        self.assertEqual(self.router.route(self.req), None)
+        self.assertEqual(self.router.route(self.req), None)
+        self.route(nfw.HTTP_GET, '/cache/b', 'c:get', {'var1': 'b'})
+        stats = self.router.cache_stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['size'], 2)
+
+        self.router.add(nfw.HTTP_GET, '/missing', self.view, 'm:get')
+        self.assertEqual(self.router.cache_stats()['size'], 0)
+        self.route(nfw.HTTP_GET, '/missing', 'm:get', {})
+
+
+class RegexRoutes(Routes):
+    matcher = 'regex'
+
+    def test_many(self):
+        for i in range(150):
+            self.router.add(nfw.HTTP_GET, '/many%s/{var1}' % (i,), self.view,
+                            'many:%s' % (i,))
+        self.route(nfw.HTTP_GET, '/many149/x', 'many:149', {'var1': 'x'})
+        self.route(nfw.HTTP_GET, '/many0/y', 'many:0', {'var1': 'y'})
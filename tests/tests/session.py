@@ -33,11 +33,54 @@ import os
 import logging
 import unittest
 import json
+import shutil
+import tempfile
+
+import mock
 
 import nfw
 
 log = logging.getLogger(__name__)
 
+
+class FakeRedis(object):
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+
+    def hgetall(self, name):
+        self.commands.append('HGETALL')
+        return dict(self.data.get(name, {}))
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline(object):
+    def __init__(self, redis):
+        self.redis = redis
+        self.queued = []
+
+    def hset(self, name, key, value):
+        self.queued.append(('HSET', name, key, value))
+
+    def hdel(self, name, *keys):
+        self.queued.append(('HDEL', name, keys))
+
+    def expire(self, name, expire):
+        self.queued.append(('EXPIRE', name))
+
+    def execute(self):
+        self.redis.commands.append('EXEC')
+        for command in self.queued:
+            data = self.redis.data.setdefault(command[1], {})
+            if command[0] == 'HSET':
+                data[command[2]] = command[3]
+            elif command[0] == 'HDEL':
+                for key in command[2]:
+                    data.pop(key, None)
+
+
 class Session(unittest.TestCase):
     def __init__(self, methodName):
         super(Session, self).__init__(methodName)
@@ -58,3 +101,175 @@ class Session(unittest.TestCase):
         session = nfw.SessionFile(config, app_root='')
         cookie = session.setup(environ)
         self.assertEqual(session['test'], 'testing')
+
+    def test_redis_pool(self):
+        config_file = (os.path.abspath(os.path.join(
+            os.path.dirname(__file__),
+            'settings.cfg')))
+        config = nfw.Config(config_file)
+        redis = nfw.redis(config)
+        self.assertIs(redis, nfw.redis(config))
+        self.assertIs(redis.connection_pool,
+                      nfw.redis(config).connection_pool)
+        nfw.redissy.close_all()
+        self.assertIsNot(redis, nfw.redis(config))
+
+    def test_redis_pipeline(self):
+        config_file = (os.path.abspath(os.path.join(
+            os.path.dirname(__file__),
+            'settings.cfg')))
+        config = nfw.Config(config_file)
+        redis = FakeRedis()
+        environ = {}
+        session = nfw.SessionRedis(config, redis=redis)
+        environ['HTTP_COOKIE'] = session.setup(environ)
+        session['user'] = 'john'
+        session['login'] = True
+        session['count'] = 1
+        session['tmp'] = 'x'
+        del session['tmp']
+        self.assertEqual(session['user'], 'john')
+        self.assertEqual(session.get('login'), True)
+        session.save()
+        self.assertEqual(redis.commands, ['HGETALL', 'EXEC'])
+
+        redis.commands = []
+        session = nfw.SessionRedis(config, redis=redis)
+        session.setup(environ)
+        self.assertEqual(session['count'], '1')
+        self.assertEqual(session['login'], True)
+        self.assertFalse('tmp' in session)
+        self.assertEqual(len(session), 3)
+        session.save()
+        self.assertEqual(redis.commands, ['HGETALL', 'EXEC'])
+
+    def test_sharded(self):
+        config_file = (os.path.abspath(os.path.join(
+            os.path.dirname(__file__),
+            'settings.cfg')))
+        config = nfw.Config(config_file)
+        app_root = tempfile.mkdtemp()
+        try:
+            environ = {}
+            session = nfw.SessionShardedFile(config, app_root=app_root)
+            environ['HTTP_COOKIE'] = session.setup(environ)
+            session.save()
+            self.assertFalse(os.path.exists(os.path.join(app_root, 'tmp')))
+
+            session['test'] = 'testing'
+            session.save()
+            path, session_file = session._file()
+            self.assertTrue(os.path.isfile(session_file))
+            inode = os.stat(session_file).st_ino
+
+            session = nfw.SessionShardedFile(config, app_root=app_root)
+            session.setup(environ)
+            self.assertEqual(session['test'], 'testing')
+            with mock.patch('nfw.session.pickle.loads') as loads:
+                session.save()
+            # Nothing is decoded again to find out the session is unchanged.
+            self.assertFalse(loads.called)
+            self.assertEqual(os.stat(session_file).st_ino, inode)
+            self.assertEqual(os.listdir(path), [os.path.basename(session_file)])
+
+            session['items'] = [1]
+            session.save()
+            inode = os.stat(session_file).st_ino
+            session = nfw.SessionShardedFile(config, app_root=app_root)
+            session.setup(environ)
+            # A value changed in place is saved without assigning it again.
+            session['items'].append(2)
+            session.save()
+            self.assertNotEqual(os.stat(session_file).st_ino, inode)
+            session = nfw.SessionShardedFile(config, app_root=app_root)
+            session.setup(environ)
+            self.assertEqual(session['items'], [1, 2])
+        finally:
+            shutil.rmtree(app_root)
+
+    def test_cookie(self):
+        config_file = (os.path.abspath(os.path.join(
+            os.path.dirname(__file__),
+            'settings.cfg')))
+        config = nfw.Config(config_file)
+        environ = {}
+        session = nfw.SessionCookie(config)
+        self.assertEqual(session.setup(environ), None)
+        self.assertEqual(session.save(), None)
+
+        session['test'] = 'testing'
+        session['items'] = [1, 2, 3]
+        cookie = session.save()
+        self.assertTrue(cookie.startswith('neutrino='))
+        environ['HTTP_COOKIE'] = cookie.split(';')[0]
+
+        session = nfw.SessionCookie(config)
+        session.setup(environ)
+        self.assertEqual(session['test'], 'testing')
+        self.assertEqual(session['items'], [1, 2, 3])
+        self.assertEqual(session.save(), None)
+
+        tampered = environ['HTTP_COOKIE'][:-1] + 'x'
+        session = nfw.SessionCookie(config)
+        session.setup({'HTTP_COOKIE': tampered})
+        self.assertFalse('test' in session)
+
+        session['big'] = os.urandom(3000).encode('hex')
+        self.assertEqual(session.save(), None)
+
+        session = nfw.SessionCookie(config)
+        session.setup({})
+        session['unencodable'] = object()
+        self.assertEqual(session.save(), None)
+
+    def test_collector(self):
+        app_root = tempfile.mkdtemp()
+        try:
+            shard = os.path.join(app_root, 'tmp', 'sessions', 'ab', 'cd')
+            os.makedirs(shard)
+            old = os.path.join(app_root, 'tmp', 'old.session')
+            new = os.path.join(app_root, 'tmp', 'new.session')
+            old_shard = os.path.join(shard, 'old.session')
+            new_shard = os.path.join(shard, 'new.session')
+            other = os.path.join(app_root, 'tmp', 'other.txt')
+            # Temporary files are only collected below tmp/sessions.
+            other_tmp = os.path.join(app_root, 'tmp', 'foo.tmp')
+            old_tmp = os.path.join(shard, '.old.tmp')
+            for f in (old, new, old_shard, new_shard, other, other_tmp,
+                      old_tmp):
+                open(f, 'w').close()
+            for f in (old, old_shard, other, other_tmp, old_tmp):
+                os.utime(f, (0, 0))
+
+            gc = nfw.SessionCollector(app_root, expire=3600, batch=1,
+                                      pause=0)
+            self.assertEqual(gc.sweep(), 3)
+            self.assertFalse(os.path.exists(old))
+            self.assertFalse(os.path.exists(old_shard))
+            self.assertFalse(os.path.exists(old_tmp))
+            self.assertTrue(os.path.exists(other_tmp))
+            self.assertTrue(os.path.exists(new))
+            self.assertTrue(os.path.exists(new_shard))
+            self.assertTrue(os.path.exists(other))
+        finally:
+            shutil.rmtree(app_root)
+
+    def test_scan_vanished(self):
+        path = tempfile.mkdtemp()
+        try:
+            for name in ('a.session', 'b.session', 'c.session'):
+                open(os.path.join(path, name), 'w').close()
+            stat = os.stat
+
+            def vanished(fpath):
+                if fpath.endswith('b.session'):
+                    raise OSError(2, 'No such file or directory')
+                return stat(fpath)
+
+            with mock.patch('nfw.session.scandir', None):
+                with mock.patch('os.stat', vanished):
+                    found = sorted(os.path.basename(f[0])
+                                   for f in nfw.session._scan(path))
+            self.assertEqual(found, ['a.session', 'c.session'])
+        finally:
+            shutil.rmtree(path)
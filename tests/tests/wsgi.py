@@ -0,0 +1,148 @@
+# Neutrino Framework
+#
+# Copyright (c) 2016-2017, Christiaan Frans Rademan
+# All rights reserved.
+#
+# LICENSE: (BSD3-Clause)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENTSHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import io
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+from wsgiref.util import FileWrapper
+
+import mock
+
+import nfw
+
+log = logging.getLogger(__name__)
+
+
+class App(object):
+    # Runs requests through Wsgi._interface of an application in a
+    # temporary folder, with a single GET /test route calling self.view.
+    settings = '[application]\nname = test\nsession_backend = file\n'
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root, 'tmp'))
+        with open(os.path.join(self.root, 'settings.cfg'), 'w') as f:
+            f.write(self.settings)
+        self.path = os.path.join(self.root, 'data.txt')
+        with open(self.path, 'wb') as f:
+            f.write(b'0123456789')
+        self.app = nfw.Wsgi(self.root)
+        self.app.router.add(nfw.HTTP_GET, '/test',
+                            lambda req, resp: self.view(req, resp))
+        self.app.router.compile()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def request(self, view, **environ):
+        self.view = view
+        env = {'REQUEST_METHOD': 'GET',
+               'SCRIPT_NAME': '',
+               'PATH_INFO': '/test',
+               'QUERY_STRING': '',
+               'REMOTE_ADDR': '127.0.0.1',
+               'SERVER_NAME': 'localhost',
+               'SERVER_PORT': '80',
+               'wsgi.url_scheme': 'http',
+               'wsgi.input': io.BytesIO()}
+        env.update(environ)
+        started = {}
+
+        def start_response(status, headers):
+            started['status'] = status
+            started['headers'] = dict((k.lower(), v) for k, v in headers)
+
+        body = self.app.application()(env, start_response)
+        return started['status'], started['headers'], body
+
+
+class Interface(App, unittest.TestCase):
+    def __init__(self, methodName):
+        super(Interface, self).__init__(methodName)
+
+    def test_send_file(self):
+        def view(req, resp):
+            resp.send_file(self.path)
+
+        status, headers, body = self.request(
+            view, **{'wsgi.file_wrapper': FileWrapper})
+        self.assertEqual(status, nfw.HTTP_200)
+        self.assertEqual(headers['content-length'], b'10')
+        self.assertIsInstance(body, FileWrapper)
+        self.assertEqual(b''.join(body), b'0123456789')
+        body.close()
+
+        status, headers, body = self.request(
+            view, HTTP_RANGE='bytes=2-4',
+            **{'wsgi.file_wrapper': FileWrapper})
+        self.assertEqual(status, nfw.HTTP_206)
+        self.assertEqual(headers['content-length'], b'3')
+        self.assertEqual(headers['content-range'], b'bytes 2-4/10')
+        self.assertEqual(b''.join(body), b'234')
+        body.close()
+
+    def test_stream(self):
+        def view(req, resp):
+            resp.stream(iter([b'ab', b'cd']), content_length=4)
+
+        status, headers, body = self.request(view)
+        self.assertEqual(headers['content-length'], b'4')
+        self.assertEqual(b''.join(body), b'abcd')
+        body.close()
+
+        def view(req, resp):
+            resp.stream(iter([b'ab', b'cd']))
+
+        status, headers, body = self.request(view)
+        self.assertNotIn('content-length', headers)
+        self.assertEqual(b''.join(body), b'abcd')
+        body.close()
+
+
+class Database(App, unittest.TestCase):
+    settings = App.settings + '[mysql]\ndatabase = test\n'
+
+    def __init__(self, methodName):
+        super(Database, self).__init__(methodName)
+
+    def test_pool_timeout(self):
+        def view(req, resp):
+            resp.body = 'not reached'
+
+        timeout = nfw.PoolTimeout('Timed out waiting for database connection')
+        with mock.patch('nfw.Mysql', side_effect=timeout):
+            status, headers, body = self.request(view)
+        self.assertEqual(status, nfw.HTTP_503)
+        self.assertIn('set-cookie', headers)
+        self.assertNotIn(b'not reached', b''.join(body))